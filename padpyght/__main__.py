@@ -1,31 +1,147 @@
 # An open source gamepad visualizer inspired by PadLight.
 # By Darren 'lifning' Alton
 
+import argparse
 import os
-import pkg_resources
 import sys
 
+import startup
+
 import pygame
 
 import configurator
-import mapper
-import visualizer
-
-
-def main(skin, joy_index):
-    pygame.display.init()
-    pygame.joystick.init()
-
-    joy = pygame.joystick.Joystick(joy_index)
-    joy.init()
-    mappings = configurator.load_mappings(skin)
-    if joy.get_name() not in mappings:
-        mapper.main(skin, joy_index)
-    visualizer.main(skin, joy_index)
-
+import scheduler
+import util
+
+startup.profile.mark('imports')
+
+
+def main(skin, joy_index, profile_startup=False, profile_calls=None,
+         **options):
+    startup.profile.enabled = profile_startup
+    if options.get('headless'):
+        os.environ['SDL_VIDEODRIVER'] = 'dummy'
+    util.init_sdl()
+    startup.profile.mark('SDL init')
+
+    joy_indices = joy_index
+    if not isinstance(joy_indices, (list, tuple)):
+        joy_indices = [joy_index]
+    if options.get('replay') is None and options.get('listen') is None \
+            and not options.get('headless'):
+        for index in joy_indices:
+            joy = pygame.joystick.Joystick(index)
+            joy.init()
+            # looked up once here, and then from the store's cache by the
+            # visualizer.
+            if configurator.mapping_store.get(
+                    skin, joy.get_name(),
+                    configurator.joystick_guid(joy)) is None:
+                import mapper
+                mapper.main(skin, index)
+                startup.profile.mark('mapping')
+        startup.profile.mark('mappings')
+    import visualizer
+    startup.profile.mark('imports')
+    if profile_calls is None:
+        visualizer.main(skin, joy_index, **options)
+    else:
+        import cProfile
+        calls = cProfile.Profile()
+        try:
+            calls.runcall(visualizer.main, skin, joy_index, **options)
+        finally:
+            calls.dump_stats(profile_calls)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='padpyght')
+    parser.add_argument('skin', nargs='?', default='gamecube')
+    parser.add_argument('joy_index', nargs='*', type=int, default=[0],
+                        help='joystick number; given several, each gets its '
+                             'own pad, tiled in a single window')
+    parser.add_argument('--columns', type=int,
+                        help='how many pads to put side by side when showing '
+                             'several joysticks (default: roughly square)')
+    parser.add_argument('--idle', action='store_true',
+                        help='block on input and only redraw when the pad '
+                             'changes, instead of drawing at a fixed rate')
+    parser.add_argument('--native', action='store_true',
+                        help='rescale the skin once per window size and draw '
+                             'at window resolution, instead of scaling every '
+                             'frame')
+    parser.add_argument('--headless', action='store_true',
+                        help='render offscreen with no window, writing raw '
+                             'RGBA frames to --output')
+    parser.add_argument('--output', default='-',
+                        help="where --headless writes frames: '-' for "
+                             'stdout, a file descriptor number, or a path')
+    parser.add_argument('--changed-only', action='store_true',
+                        help='with --headless, only write frames that differ '
+                             'from the previous one')
+    parser.add_argument('--no-frame-header', dest='frame_header',
+                        action='store_false',
+                        help='with --headless, write bare pixels with no '
+                             'per-frame header, as plain rawvideo')
+    parser.add_argument('--filter', dest='scale_filter', metavar='NAME',
+                        help='scale the pad up with a pixel-art filter '
+                             '(nearest, scale2x, scale3x, scale4x or edge), '
+                             'using NumPy, to the largest whole multiple '
+                             'of its size that fits the window')
+    parser.add_argument('--history', action='store_true',
+                        help='show a fighting-game style input history, '
+                             'with frame counts, beside each pad')
+    parser.add_argument('--stats', metavar='PATH',
+                        help='keep a heatmap of where each stick has been '
+                             'and count presses of everything else, and '
+                             'write them to PATH as a NumPy .npz on exit')
+    parser.add_argument('--heatmap', action='store_true',
+                        help="shade each stick's area by how much it's "
+                             'been used lately')
+    parser.add_argument('--record', metavar='PATH',
+                        help='record every joystick event to a binary log')
+    parser.add_argument('--replay', metavar='PATH',
+                        help='play back a log made with --record instead of '
+                             'reading the joystick')
+    parser.add_argument('--replay-speed', type=float, default=1.0,
+                        help='multiple of real time to replay at, or 0 for '
+                             'as fast as possible (default: 1)')
+    parser.add_argument('--latency-log', metavar='PATH',
+                        help='write the input-to-present latency '
+                             'histogram here as JSON on exit (F3 shows its '
+                             'percentiles in the window title either way)')
+    parser.add_argument('--listen', metavar='[HOST:]PORT',
+                        help='take input from python2 -m padpyght.netinput '
+                             'running on another machine, instead of '
+                             'reading the joystick')
+    parser.add_argument('--tcp', action='store_true',
+                        help='with --listen, accept a TCP connection '
+                             'instead of UDP packets')
+    parser.add_argument('--serve', metavar='[HOST:]PORT',
+                        help='serve a page that draws the pad in a browser '
+                             '(or a browser source), kept up to date over a '
+                             'WebSocket; only on 127.0.0.1 unless HOST is '
+                             'given')
+    parser.add_argument('--profile', metavar='PATH',
+                        help='time each phase of every frame, and count '
+                             'what was drawn, writing a row per frame to '
+                             'PATH as CSV; F4 shows averages on screen '
+                             'either way')
+    parser.add_argument('--profile-calls', metavar='PATH',
+                        help='run the visualizer under cProfile and write '
+                             'its stats to PATH, for pstats or snakeviz')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='print how long each phase of startup took, '
+                             'once the first frame is up')
+    parser.add_argument('--schedule', choices=scheduler.POLICIES,
+                        default='deadline',
+                        help="when to present frames: 'deadline' wakes just "
+                             "in time for each frame, 'lowlatency' also "
+                             "presents as soon as input arrives, and "
+                             "'adaptive' is the old fixed frame rate that "
+                             "halves when frames run late (default: deadline)")
+    return parser.parse_args(argv)
 
-_skin = 'gamecube'
-_joy_index = 0
 
 try:
     if len(sys.argv) > 1:
@@ -35,13 +151,14 @@ try:
     import pgu.gui
 except ImportError:
     pgu = None
-    if len(sys.argv) > 1:
-        _skin = sys.argv[1]
-    if len(sys.argv) > 2:
-        _joy_index = int(sys.argv[2])
-    main(_skin, _joy_index)
+    _args = vars(parse_args(sys.argv[1:]))
+    main(_args.pop('skin'), _args.pop('joy_index'), **_args)
     sys.exit()
 
+# only the launcher needs these up front.
+import catalog
+import mapper
+
 app = pgu.gui.Desktop()
 app.connect(pgu.gui.QUIT, app.quit, None)
 box = pgu.gui.Container(width=320, height=400)
@@ -54,30 +171,15 @@ box.add(skin_list, 4, 180)
 box.add(run_btn, 4, 350)
 box.add(remap_btn, 225, 350)
 
-pygame.joystick.init()
+util.init_sdl()
 for i in xrange(pygame.joystick.get_count()):
     name = pygame.joystick.Joystick(i).get_name()
     joy_list.add('{}: {}'.format(i, name), value=i)
 
 
-def list_skin_paths():
-    if getattr(sys, 'frozen', False):
-        base_dir = os.path.join(sys._MEIPASS, 'padpyght', 'skins')
-        for dir_name in os.listdir(base_dir):
-            path = os.path.join(base_dir, dir_name)
-            yield dir_name, path
-    else:
-        for dir_name in pkg_resources.resource_listdir('padpyght', 'skins'):
-            path = pkg_resources.resource_filename('padpyght',
-                                                   'skins/%s' % dir_name)
-            yield dir_name, path
-
-for dir_name, path in list_skin_paths():
-    cfg = os.path.join(path, 'skin.json')
-    if os.path.exists(cfg):
-        skin_list.add(dir_name, value=dir_name)
-    else:
-        print 'skin.json missing from', path
+for skin_name in catalog.catalog.refresh():
+    skin_list.add(skin_name, image=catalog.catalog.thumbnail(skin_name),
+                  value=skin_name)
 
 
 def main_wrapper():
@@ -0,0 +1,92 @@
+"""Sprite atlases: many small images packed into one surface.
+
+Each image is trimmed to the bounding box of its visible pixels before it's
+packed, and the atlas is converted to the display's pixel format once it's
+made, so drawing a sprite is a blit of only its visible pixels from a
+surface that needs no conversion on the way to the screen.
+"""
+
+import math
+
+import pygame
+
+
+def display_format(surface):
+    """The surface in the display's pixel format, keeping any transparency,
+    or as it is if there's no display to match yet."""
+    if pygame.display.get_surface() is None:
+        return surface
+    if surface.get_flags() & pygame.SRCALPHA or \
+            surface.get_colorkey() is not None:
+        return surface.convert_alpha()
+    return surface.convert()
+
+
+class Sprite:
+    """An image in an atlas.  It stands in for the image it was made from,
+    as far as its size goes, while only the area of the atlas holding its
+    visible pixels (found at offset within the original) gets drawn."""
+
+    def __init__(self, surface, area, offset, size):
+        self.surface = surface
+        self.area = area
+        self.offset = offset
+        self.size = size
+
+    def get_size(self):
+        return self.size
+
+    def get_rect(self, **kwargs):
+        rect = pygame.Rect((0, 0), self.size)
+        for name, value in kwargs.iteritems():
+            setattr(rect, name, value)
+        return rect
+
+    def cropped(self, size):
+        """What's drawn of the image when it's cropped to size from its top
+        left corner: the surface and area of it to blit, and where the area
+        goes relative to where the image would."""
+        visible = pygame.Rect(self.offset, self.area.size).clip(
+            pygame.Rect((0, 0), size))
+        area = visible.move(self.area.left - self.offset[0],
+                            self.area.top - self.offset[1])
+        return self.surface, visible.topleft, area
+
+
+def pack(images):
+    """Packs a dict of name to surface into one atlas, returning a dict of
+    name to Sprite."""
+    trimmed = dict()
+    for name, image in images.iteritems():
+        # blitting onto a per-pixel alpha surface turns a colorkey into alpha
+        # too, so the bounding box is right either way.
+        rgba = pygame.Surface(image.get_size(), pygame.SRCALPHA, 32)
+        rgba.blit(image, (0, 0))
+        bounds = rgba.get_bounding_rect()
+        trimmed[name] = (rgba.subsurface(bounds), bounds, image.get_size())
+
+    # shelves, tallest first, in rows about as wide as the atlas is tall.
+    area = sum(bounds.w * bounds.h for _, bounds, _ in trimmed.itervalues())
+    width = max([int(math.sqrt(area) * 1.2)] +
+                [bounds.w for _, bounds, _ in trimmed.itervalues()] + [1])
+    order = sorted(trimmed, key=lambda name: -trimmed[name][1].h)
+    places = dict()
+    x = y = shelf_height = 0
+    for name in order:
+        bounds = trimmed[name][1]
+        if x + bounds.w > width:
+            x, y, shelf_height = 0, y + shelf_height, 0
+        places[name] = pygame.Rect((x, y), bounds.size)
+        x += bounds.w
+        shelf_height = max(shelf_height, bounds.h)
+
+    surface = pygame.Surface((width, max(1, y + shelf_height)),
+                             pygame.SRCALPHA, 32)
+    surface.fill((0, 0, 0, 0))
+    for name, place in places.iteritems():
+        surface.blit(trimmed[name][0], place)
+    surface = display_format(surface)
+
+    return dict((name, Sprite(surface, places[name], trimmed[name][1].topleft,
+                              trimmed[name][2]))
+                for name in places)
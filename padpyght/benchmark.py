@@ -0,0 +1,430 @@
+import argparse
+import collections
+import contextlib
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import timeit
+
+import pygame
+
+import bundle
+import catalog
+import configurator
+import filters
+import frame_buffer
+import visualizer
+
+SCALE_TYPES = ('pixelperfect', 'scale2x', 'proportional', 'stretch',
+               'centered')
+# the NumPy filters, as scale types of their own, where NumPy is installed.
+if filters.available():
+    SCALE_TYPES += tuple('filter-%s' % name for name in filters.FILTERS)
+
+
+def bundled_skins():
+    skins_dir = os.path.join(os.path.dirname(__file__), 'skins')
+    return sorted(name for name in os.listdir(skins_dir) if os.path.exists(
+        os.path.join(skins_dir, name, 'skin.json')))
+
+
+def synthetic_mapping(cfg):
+    # a mapping in the same shape the mapper writes, binding every element of
+    # the skin to some button or axis, so no joystick is needed to drive it.
+    mapping = {'button': dict(), 'axis': dict(), 'hat': dict()}
+    axis = 0
+    for name in cfg.buttons:
+        mapping['button'][str(len(mapping['button']))] = {
+            'type': 'button', 'name': name}
+    for name, stick in cfg.sticks.iteritems():
+        for negative, positive in (('left', 'right'), ('up', 'down')):
+            mapping['axis'][str(axis)] = {
+                '-1': {'type': 'stick', 'name': name, 'direction': negative},
+                '+1': {'type': 'stick', 'name': name, 'direction': positive}}
+            axis += 1
+        if stick.clickable:
+            mapping['button'][str(len(mapping['button']))] = {
+                'type': 'stick', 'name': name, 'direction': 'click'}
+    for name in cfg.triggers:
+        mapping['axis'][str(axis)] = {'+2': {'type': 'trigger', 'name': name}}
+        axis += 1
+    return mapping
+
+
+def synthetic_events(mapping, count, seed=0):
+    # mostly axis motion, as a fast analog stick would produce.
+    rng = random.Random(seed)
+    axes = [int(a) for a in mapping['axis']]
+    buttons = [int(b) for b in mapping['button']]
+    events = list()
+    for _ in xrange(count):
+        if axes and (not buttons or rng.random() < 0.9):
+            events.append(pygame.event.Event(
+                pygame.JOYAXISMOTION, joy=0, axis=rng.choice(axes),
+                value=rng.uniform(-1, 1)))
+        else:
+            kind = rng.choice((pygame.JOYBUTTONDOWN, pygame.JOYBUTTONUP))
+            events.append(pygame.event.Event(kind, joy=0,
+                                             button=rng.choice(buttons)))
+    return events
+
+
+def legacy_dispatch(mapping, pad_gfx, event):
+    # the per-event walk of the JSON mapping that InputDispatcher replaced,
+    # kept only as the baseline to compare against.
+    button_map = mapping.get('button', dict())
+    axis_map = mapping.get('axis', dict())
+    hat_map = mapping.get('hat', dict())
+    get_target = visualizer._get_target
+    if event.type == pygame.JOYBUTTONDOWN:
+        if str(event.button) in button_map:
+            elt = button_map[str(event.button)]
+            get_target(pad_gfx, elt).push(1)
+    elif event.type == pygame.JOYBUTTONUP:
+        if str(event.button) in button_map:
+            elt = button_map[str(event.button)]
+            get_target(pad_gfx, elt).push(0)
+    elif event.type == pygame.JOYAXISMOTION:
+        if str(event.axis) in axis_map:
+            for change, elt in axis_map[str(event.axis)].iteritems():
+                change = int(change)
+                value = event.value
+                if abs(change) == 2:
+                    value += change / abs(change)
+                value /= change
+                value = max(0, value)
+                get_target(pad_gfx, elt).push(value)
+    elif event.type == pygame.JOYHATMOTION:
+        if str(event.hat) in hat_map:
+            direction_map = hat_map[str(event.hat)]
+            x, y = event.value
+            if 'up' in direction_map:
+                get_target(pad_gfx, direction_map['up']).push(y)
+            if 'down' in direction_map:
+                get_target(pad_gfx, direction_map['down']).push(-y)
+            if 'left' in direction_map:
+                get_target(pad_gfx, direction_map['left']).push(-x)
+            if 'right' in direction_map:
+                get_target(pad_gfx, direction_map['right']).push(x)
+
+
+def bench_dispatch(skin, count):
+    cfg = configurator.PadConfig(skin)
+    pad_gfx = visualizer.PadImage(cfg, pygame.Surface(cfg.size))
+    mapping = synthetic_mapping(cfg)
+    events = synthetic_events(mapping, count)
+
+    start = timeit.default_timer()
+    for event in events:
+        legacy_dispatch(mapping, pad_gfx, event)
+    legacy = count / (timeit.default_timer() - start)
+
+    dispatcher = visualizer.InputDispatcher(mapping, pad_gfx)
+    start = timeit.default_timer()
+    for event in events:
+        dispatcher.dispatch(event)
+    compiled = count / (timeit.default_timer() - start)
+    return legacy, compiled
+
+
+def _time_startup(skin):
+    start = timeit.default_timer()
+    cfg, preloaded = bundle.open_skin(skin)
+    images = visualizer.SkinImages(cfg.path, preloaded=preloaded)
+    visualizer.PadImage(cfg, pygame.Surface(cfg.size), images)
+    return timeit.default_timer() - start
+
+
+@contextlib.contextmanager
+def scratch_config():
+    # opening a skin writes its bundle and catalog entry, so benchmarks run
+    # in a scratch config directory and leave the user's alone.
+    data_root = configurator.data_root
+    skin_catalog = catalog.catalog
+    scratch = tempfile.mkdtemp(prefix='padpyght-benchmark-')
+    configurator.data_root = scratch
+    catalog.catalog = catalog.SkinCatalog()
+    try:
+        yield
+    finally:
+        configurator.data_root = data_root
+        catalog.catalog = skin_catalog
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def bench_startup(skin, repeat):
+    # cold: no bundle, so every PNG is decoded and the bundle is written.
+    # warm: the bundle written by the cold run is mapped instead.
+    with scratch_config():
+        cold = _time_startup(skin)
+        warm = min(_time_startup(skin) for _ in xrange(repeat))
+    return cold, warm
+
+
+def _stick_and_trigger_axes(mapping):
+    sticks = sorted(int(axis) for axis, changes in mapping['axis'].iteritems()
+                    if '+1' in changes)
+    triggers = sorted(int(axis) for axis, changes
+                      in mapping['axis'].iteritems() if '+2' in changes)
+    return sticks, triggers
+
+
+def _idle_pattern(mapping, frame):
+    return []
+
+
+def _mash_pattern(mapping, frame):
+    # every button goes down and back up every four frames, staggered.
+    events = list()
+    for button in mapping['button']:
+        phase = (frame + int(button)) % 4
+        if phase == 0:
+            events.append(pygame.event.Event(pygame.JOYBUTTONDOWN, joy=0,
+                                             button=int(button)))
+        elif phase == 2:
+            events.append(pygame.event.Event(pygame.JOYBUTTONUP, joy=0,
+                                             button=int(button)))
+    return events
+
+
+def _circle_pattern(mapping, frame):
+    # one full turn of every stick per second, four axis events per frame
+    # per stick, as a real stick would send several between frames.
+    events = list()
+    sticks, _ = _stick_and_trigger_axes(mapping)
+    for step in xrange(4):
+        angle = (frame * 4 + step) * math.pi / 120
+        for x_axis, y_axis in zip(sticks[0::2], sticks[1::2]):
+            events.append(pygame.event.Event(pygame.JOYAXISMOTION, joy=0,
+                                             axis=x_axis,
+                                             value=math.cos(angle)))
+            events.append(pygame.event.Event(pygame.JOYAXISMOTION, joy=0,
+                                             axis=y_axis,
+                                             value=math.sin(angle)))
+    return events
+
+
+def _sweep_pattern(mapping, frame):
+    # triggers all the way in and back out once a second.
+    _, triggers = _stick_and_trigger_axes(mapping)
+    value = abs((frame % 60) - 30) / 15.0 - 1
+    return [pygame.event.Event(pygame.JOYAXISMOTION, joy=0, axis=axis,
+                               value=value) for axis in triggers]
+
+
+def _everything_pattern(mapping, frame):
+    return (_mash_pattern(mapping, frame) + _circle_pattern(mapping, frame) +
+            _sweep_pattern(mapping, frame))
+
+
+PATTERNS = collections.OrderedDict((
+    ('idle', _idle_pattern),
+    ('mash', _mash_pattern),
+    ('circles', _circle_pattern),
+    ('sweeps', _sweep_pattern),
+    ('all', _everything_pattern),
+))
+
+
+def bench_render(skin, scale_type, pattern, frames, window_scale):
+    cfg, preloaded = bundle.open_skin(skin)
+    w, h = cfg.size
+    scale_filter = None
+    if scale_type.startswith('filter-'):
+        scale_filter = scale_type[len('filter-'):]
+        # a filter that doesn't fit the window isn't run at all, so the
+        # window is made large enough for it.
+        window_scale = max(window_scale,
+                           float(filters.FILTERS[scale_filter].factor))
+    # the dummy driver's display is 8-bit unless asked otherwise, which
+    # nothing padpyght draws with is meant for.
+    fb = frame_buffer.FrameBuffer(
+        (int(w * window_scale), int(h * window_scale)), cfg.size,
+        scale_type='filter' if scale_filter else scale_type,
+        scale_smooth=cfg.anti_aliasing,
+        background_color=cfg.background_color, scale_filter=scale_filter,
+        depth=32)
+    images = visualizer.SkinImages(cfg.path, preloaded=preloaded)
+    pad_gfx = visualizer.PadImage(cfg, fb, images)
+    mapping = synthetic_mapping(cfg)
+    dispatcher = visualizer.InputDispatcher(mapping, pad_gfx)
+    make_events = PATTERNS[pattern]
+
+    # the first frame is always a full flip, so leave it out.
+    pad_gfx.draw()
+    fb.update(delay=False)
+
+    timer = timeit.default_timer
+    event_count = 0
+    dispatch_time = draw_time = flip_time = 0.0
+    frame_times = list()
+    start = timer()
+    for frame in xrange(frames):
+        events = make_events(mapping, frame)
+        t0 = timer()
+        for event in events:
+            dispatcher.dispatch(event)
+        t1 = timer()
+        pad_gfx.draw()
+        t2 = timer()
+        fb.update(delay=False)
+        t3 = timer()
+        event_count += len(events)
+        dispatch_time += t1 - t0
+        draw_time += t2 - t1
+        flip_time += t3 - t2
+        frame_times.append(t3 - t0)
+    total_time = timer() - start
+    frame_times.sort()
+
+    return {
+        'skin': skin, 'scale': scale_type, 'pattern': pattern,
+        'frames': frames, 'window_scale': window_scale,
+        'draw_ms': draw_time * 1000 / frames,
+        'flip_ms': flip_time * 1000 / frames,
+        'fps': frames / total_time,
+        # unlike the averages, hardly moved by the odd frame that something
+        # else running on the machine held up.
+        'median_ms': frame_times[frames // 2] * 1000,
+        'events_per_sec': event_count / dispatch_time if event_count else 0,
+    }
+
+
+def _result_key(result):
+    return result['skin'], result['scale'], result['pattern']
+
+
+def find_regressions(results, baseline, tolerance, min_ms):
+    """Results whose median frame took more than tolerance (a fraction)
+    longer than the matching baseline result's, and at least min_ms longer,
+    as (result, baseline result) pairs.  Cases that hardly do anything take
+    microseconds a frame, swinging by more than any tolerance from run to
+    run; min_ms keeps them out of it."""
+    previous = dict((_result_key(r), r) for r in baseline['results'])
+    regressions = list()
+    for result in results['results']:
+        old = previous.get(_result_key(result))
+        if old is None or 'median_ms' not in old:
+            continue
+        slower = result['median_ms'] - old['median_ms']
+        if slower > old['median_ms'] * tolerance and slower >= min_ms:
+            regressions.append((result, old))
+    return regressions
+
+
+def run_render_suite(skins, scale_types, patterns, frames, window_scale,
+                     repeat=1):
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+    pygame.display.init()
+    results = list()
+    with scratch_config():
+        for skin in skins:
+            for scale_type in scale_types:
+                for pattern in patterns:
+                    # the best of a few runs, since anything else running
+                    # on the machine only ever makes one slower.
+                    result = min((bench_render(skin, scale_type, pattern,
+                                               frames, window_scale)
+                                  for _ in xrange(repeat)),
+                                 key=lambda result: result['median_ms'])
+                    sys.stderr.write(
+                        '{skin} {scale} {pattern}: {fps:.1f} fps, draw '
+                        '{draw_ms:.3f} ms, flip {flip_ms:.3f} ms, median '
+                        'frame {median_ms:.3f} ms, {events_per_sec:.0f} '
+                        'events/s\n'.format(**result))
+                    results.append(result)
+    return {'frames': frames, 'window_scale': window_scale,
+            'repeat': repeat, 'results': results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='padpyght.benchmark')
+    subparsers = parser.add_subparsers(dest='command')
+
+    dispatch_parser = subparsers.add_parser(
+        'dispatch', help='events/second through the joystick dispatch')
+    dispatch_parser.add_argument('skins', nargs='*', default=['gamecube'])
+    dispatch_parser.add_argument('--events', type=int, default=200000)
+
+    startup_parser = subparsers.add_parser(
+        'startup', help='skin load time with and without a bundle')
+    startup_parser.add_argument('skins', nargs='*')
+    startup_parser.add_argument('--repeat', type=int, default=5)
+
+    render_parser = subparsers.add_parser(
+        'render', help='draw and flip times for every skin, scale mode and '
+                       'input pattern, under the dummy video driver')
+    render_parser.add_argument('skins', nargs='*')
+    render_parser.add_argument('--scale', dest='scale_types',
+                               action='append', choices=SCALE_TYPES)
+    render_parser.add_argument('--pattern', dest='patterns', action='append',
+                               choices=PATTERNS.keys())
+    render_parser.add_argument('--frames', type=int, default=300)
+    render_parser.add_argument('--repeat', type=int, default=3,
+                               help='run each case this many times and keep '
+                                    'the fastest (default: 3)')
+    render_parser.add_argument('--window-scale', type=float, default=2.0,
+                               help='window size as a multiple of the skin '
+                                    'size, or the filter\'s own scale if '
+                                    'that\'s larger (default: 2)')
+    render_parser.add_argument('--output', metavar='PATH',
+                               help='write results as JSON here instead of '
+                                    'to stdout')
+    render_parser.add_argument('--baseline', metavar='PATH',
+                               help='compare against results saved earlier '
+                                    'with --output, failing on regressions')
+    render_parser.add_argument('--tolerance', type=float, default=0.25,
+                               help='fraction by which a case\'s median '
+                                    'frame time may grow before it counts '
+                                    'as a regression (default: 0.25)')
+    render_parser.add_argument('--min-ms', type=float, default=0.1,
+                               help='milliseconds the median frame must '
+                                    'also have grown by to count as a '
+                                    'regression '
+                                    '(default: 0.1)')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'dispatch':
+        for skin in args.skins:
+            legacy, compiled = bench_dispatch(skin, args.events)
+            print '{}: {:.0f} events/s before, {:.0f} events/s after ' \
+                  '({:.2f}x)'.format(skin, legacy, compiled,
+                                     compiled / legacy)
+    elif args.command == 'startup':
+        for skin in args.skins or bundled_skins():
+            cold, warm = bench_startup(skin, args.repeat)
+            print '{}: {:.1f} ms cold, {:.1f} ms warm'.format(
+                skin, cold * 1000, warm * 1000)
+    elif args.command == 'render':
+        results = run_render_suite(args.skins or bundled_skins(),
+                                   args.scale_types or SCALE_TYPES,
+                                   args.patterns or PATTERNS.keys(),
+                                   args.frames, args.window_scale,
+                                   args.repeat)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+        else:
+            print json.dumps(results, indent=2, sort_keys=True)
+        if args.baseline:
+            with open(args.baseline, 'r') as f:
+                baseline = json.load(f)
+            regressions = find_regressions(results, baseline, args.tolerance,
+                                           args.min_ms)
+            for result, old in regressions:
+                sys.stderr.write(
+                    'REGRESSION {} {} {}: {:.3f} ms a frame, was {:.3f}\n'
+                    .format(result['skin'], result['scale'],
+                            result['pattern'], result['median_ms'],
+                            old['median_ms']))
+            if regressions:
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,378 @@
+"""Pad state broadcast for browser-source overlays.
+
+The visualizer can serve the pad's logical state over HTTP, for a page in a
+browser (or a streaming program's browser source) to draw the pad itself:
+
+    /                   a page that draws the pads from the rest of these
+    /layout.json        the skin's parsed skin.json, plus how the pads are
+                        tiled, fetched once
+    /images/NAME.png    the skin's images, fetched once each
+    /state              a WebSocket that sends the whole state as JSON on
+                        connecting, then one delta per frame in which
+                        anything changed
+
+A state is {"pads": {"0": {"buttons": {name: pressed}, "sticks": {name:
+[x, y, pressed]}, "triggers": {name: value}}, ...}}, and a delta is the same
+with only what changed.  Each frame's delta is encoded once, however many
+clients there are.  A client that falls too far behind has its queued
+deltas thrown away and is sent the whole state instead, so a slow viewer
+can neither hold up the render loop nor pile up memory.
+"""
+
+import base64
+import BaseHTTPServer
+import collections
+import hashlib
+import json
+import os
+import SocketServer
+import struct
+import threading
+
+import util
+
+_WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+_QUEUE_LENGTH = 30  # half a second of deltas
+
+
+def pad_state(pad):
+    """The logical state of a PadImage, as plain JSON-able data."""
+    sticks = dict()
+    for name, stick in pad.sticks.iteritems():
+        directions = stick.directions
+        sticks[name] = [directions['right'].value - directions['left'].value,
+                        directions['down'].value - directions['up'].value,
+                        stick.pressed]
+    return {'buttons': dict((name, button.pressed)
+                            for name, button in pad.buttons.iteritems()),
+            'sticks': sticks,
+            'triggers': dict((name, trigger.value)
+                             for name, trigger in pad.triggers.iteritems())}
+
+
+def _delta(old, new):
+    # whatever in new differs from old, nested dicts and all.
+    result = dict()
+    for key, value in new.iteritems():
+        old_value = old.get(key)
+        if isinstance(value, dict) and isinstance(old_value, dict):
+            value = _delta(old_value, value)
+            if value:
+                result[key] = value
+        elif value != old_value:
+            result[key] = value
+    return result
+
+
+def _websocket_frame(text):
+    # a single unmasked text frame, as a server sends them.
+    data = text.encode('utf-8')
+    if len(data) < 126:
+        header = struct.pack('!BB', 0x81, len(data))
+    elif len(data) < 0x10000:
+        header = struct.pack('!BBH', 0x81, 126, len(data))
+    else:
+        header = struct.pack('!BBQ', 0x81, 127, len(data))
+    return header + data
+
+
+class _Client:
+    """One viewer's queue of frames yet to be sent."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._frames = collections.deque()
+        self._resync = True
+        self.closed = False
+
+    def put(self, frame):
+        with self._condition:
+            if len(self._frames) >= _QUEUE_LENGTH:
+                self._frames.clear()
+                self._resync = True
+            elif not self._resync:
+                self._frames.append(frame)
+            self._condition.notify()
+
+    def get(self, timeout=1.0):
+        """Returns (resync, frames) once there's anything to send."""
+        with self._condition:
+            if not self._frames and not self._resync and not self.closed:
+                self._condition.wait(timeout)
+            frames = list(self._frames)
+            self._frames.clear()
+            resync, self._resync = self._resync, False
+            return resync, frames
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify()
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    server_version = 'padpyght'
+    # browsers won't upgrade to a WebSocket over HTTP/1.0.
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, content_type, body):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        broadcaster = self.server.broadcaster
+        path = self.path.split('?')[0]
+        if path == '/':
+            self._send('text/html; charset=utf-8', _PAGE)
+        elif path == '/layout.json':
+            self._send('application/json', broadcaster.layout)
+        elif path.startswith('/images/') and path.endswith('.png'):
+            image = broadcaster.image(path[len('/images/'):-len('.png')])
+            if image is None:
+                self.send_error(404)
+            else:
+                self._send('image/png', image)
+        elif path == '/state' and self.headers.get('Upgrade', '').lower() \
+                == 'websocket':
+            self._stream_state(broadcaster)
+        else:
+            self.send_error(404)
+
+    def _stream_state(self, broadcaster):
+        key = self.headers.get('Sec-WebSocket-Key', '')
+        accept = base64.b64encode(hashlib.sha1(key + _WEBSOCKET_GUID).digest())
+        self.send_response(101, 'Switching Protocols')
+        self.send_header('Upgrade', 'websocket')
+        self.send_header('Connection', 'Upgrade')
+        self.send_header('Sec-WebSocket-Accept', accept)
+        self.end_headers()
+        self.wfile.flush()
+        self.close_connection = 1
+
+        client = broadcaster.subscribe()
+        try:
+            while not client.closed:
+                resync, frames = client.get()
+                if resync:
+                    frames = [broadcaster.snapshot_frame()]
+                for frame in frames:
+                    self.wfile.write(frame)
+                self.wfile.flush()
+        except (IOError, OSError):
+            pass  # the viewer went away
+        finally:
+            broadcaster.unsubscribe(client)
+
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class Broadcaster:
+    """Serves pads' state to any number of browsers, from a thread of its
+    own; the render loop only calls publish() once per frame."""
+
+    def __init__(self, address, cfg, pads, columns):
+        self.cfg = cfg
+        self.layout = json.dumps({'skin': cfg.parsed, 'pads': len(pads),
+                                  'columns': columns})
+        self._images = dict()
+        self._image_names = frozenset(cfg.image_names())
+        self._lock = threading.Lock()
+        self._clients = list()
+        self._state = self._pads_state(pads)
+        self._server = _Server(address, _Handler)
+        self._server.broadcaster = self
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    @staticmethod
+    def _pads_state(pads):
+        return {'pads': dict((str(i), pad_state(pad))
+                             for i, pad in enumerate(pads))}
+
+    def image(self, name):
+        if name not in self._image_names:
+            return None
+        with self._lock:
+            data = self._images.get(name)
+        if data is None:
+            with open(os.path.join(self.cfg.path, '%s.png' % name),
+                      'rb') as f:
+                data = f.read()
+            with self._lock:
+                self._images[name] = data
+        return data
+
+    def subscribe(self):
+        client = _Client()
+        with self._lock:
+            self._clients.append(client)
+        return client
+
+    def unsubscribe(self, client):
+        with self._lock:
+            if client in self._clients:
+                self._clients.remove(client)
+
+    def snapshot_frame(self):
+        with self._lock:
+            state = self._state
+        return _websocket_frame(json.dumps(state, separators=(',', ':')))
+
+    def publish(self, pads):
+        """Queues whatever changed in the pads since the last call."""
+        state = self._pads_state(pads)
+        delta = _delta(self._state, state)
+        if not delta:
+            return
+        frame = _websocket_frame(json.dumps(
+            dict(delta, time=util.monotonic()), separators=(',', ':')))
+        with self._lock:
+            self._state = state
+            clients = list(self._clients)
+        for client in clients:
+            client.put(frame)
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            client.close()
+
+
+_PAGE = '''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>padpyght</title>
+<style>
+html, body { margin: 0; background: transparent; overflow: hidden; }
+#pads { position: relative; transform-origin: 0 0; }
+.layer { position: absolute; overflow: hidden; }
+.layer img { position: absolute; left: 0; top: 0; }
+</style></head>
+<body><div id="pads"></div>
+<script>
+function layer(parent, x, y, w, h, src) {
+  var div = document.createElement('div');
+  div.className = 'layer';
+  div.style.left = x + 'px'; div.style.top = y + 'px';
+  if (w === null) {
+    div.style.overflow = 'visible';
+  } else {
+    div.style.width = w + 'px'; div.style.height = h + 'px';
+  }
+  var img = document.createElement('img');
+  img.src = 'images/' + src + '.png';
+  div.appendChild(img);
+  parent.appendChild(div);
+  return {div: div, img: img};
+}
+function centre(l, pos) {
+  // buttons and sticks are centred on their position, like the visualizer.
+  l.img.onload = function () {
+    l.div.style.left = (pos[0] - l.img.width / 2) + 'px';
+    l.div.style.top = (pos[1] - l.img.height / 2) + 'px';
+  };
+}
+function build(root, skin, ox, oy) {
+  var g = skin.general, bg = g.background, pad = {buttons: {}, sticks: {},
+                                                  triggers: {}};
+  var base = layer(root, ox, oy, g.size[0], g.size[1], bg);
+  base.div.style.background = 'rgb(' + g['background-color'].join(',') + ')';
+  var name, c, l;
+  for (name in skin.triggers || {}) {
+    c = skin.triggers[name];
+    var x = ox + c.position[0] - Math.floor(c.size[0] / 2);
+    var y = oy + c.position[1] - Math.floor(c.size[1] / 2);
+    l = layer(root, x, y, c.size[0], c.size[1], name);
+    pad.triggers[name] = {l: l, y: y, depth: c.depth};
+  }
+  for (name in skin.triggers || {}) {
+    // the shell over the trigger's travel, so it slides in underneath.
+    c = skin.triggers[name];
+    var sx = c.position[0] - Math.floor(c.size[0] / 2) - c.depth;
+    var sy = c.position[1] - Math.floor(c.size[1] / 2) - c.depth;
+    l = layer(root, ox + sx, oy + sy, c.size[0] + 2 * c.depth,
+              c.size[1] + 2 * c.depth, bg);
+    l.img.style.left = -sx + 'px'; l.img.style.top = -sy + 'px';
+  }
+  for (name in skin.buttons || {}) {
+    c = skin.buttons[name];
+    l = layer(root, 0, 0, null, null, name);
+    centre(l, [ox + c.position[0], oy + c.position[1]]);
+    l.div.style.visibility = 'hidden';
+    pad.buttons[name] = l;
+  }
+  for (name in skin.sticks || {}) {
+    c = skin.sticks[name];
+    l = layer(root, 0, 0, null, null, name);
+    centre(l, [ox + c.position[0], oy + c.position[1]]);
+    pad.sticks[name] = {l: l, radius: c.radius, name: name,
+                        clickable: !!c.clickable};
+  }
+  return pad;
+}
+function apply(pad, delta) {
+  var name, v;
+  for (name in delta.buttons || {}) {
+    pad.buttons[name].div.style.visibility =
+      delta.buttons[name] ? 'visible' : 'hidden';
+  }
+  for (name in delta.sticks || {}) {
+    var s = pad.sticks[name]; v = delta.sticks[name];
+    var x = v[0], y = v[1], d = Math.sqrt(x * x + y * y);
+    if (d > 1) { x /= d; y /= d; }
+    s.l.img.style.transform = 'translate(' + Math.trunc(x * s.radius) +
+      'px,' + Math.trunc(y * s.radius) + 'px)';
+    if (s.clickable) {
+      s.l.img.src = 'images/' + name + (v[2] ? '-click' : '') + '.png';
+    }
+  }
+  for (name in delta.triggers || {}) {
+    var t = pad.triggers[name];
+    t.l.div.style.top = (t.y + Math.trunc(delta.triggers[name] * t.depth)) +
+      'px';
+  }
+}
+fetch('layout.json').then(function (r) { return r.json(); })
+.then(function (layout) {
+  var root = document.getElementById('pads'), size = layout.skin.general.size;
+  var pads = [];
+  for (var i = 0; i < layout.pads; i++) {
+    pads.push(build(root, layout.skin, (i % layout.columns) * size[0],
+                    Math.floor(i / layout.columns) * size[1]));
+  }
+  var rows = Math.ceil(layout.pads / layout.columns);
+  function fit() {
+    root.style.transform = 'scale(' + Math.min(
+      window.innerWidth / (size[0] * layout.columns),
+      window.innerHeight / (size[1] * rows)) + ')';
+  }
+  window.onresize = fit; fit();
+  function connect() {
+    var ws = new WebSocket(location.href.replace(/^http/, 'ws')
+                           .replace(/[^\\/]*$/, 'state'));
+    ws.onmessage = function (m) {
+      var state = JSON.parse(m.data);
+      for (var i in state.pads) { apply(pads[+i], state.pads[i]); }
+    };
+    ws.onclose = function () { setTimeout(connect, 1000); };
+  }
+  connect();
+});
+</script></body></html>
+'''
@@ -0,0 +1,171 @@
+"""Compiled skin bundles.
+
+A bundle is a single file holding a skin's parsed layout along with the raw
+pixels of every image it uses, so that it can be memory-mapped and wrapped
+as surfaces without decoding a single PNG.  The layout of the file is:
+
+    header     magic, format version, length of the index
+    index      JSON: the parsed skin.json, the (mtime, size) of every source
+               file the bundle was made from, and for each image its size,
+               pixel format and where its pixels start in the file
+    pixels     each image's rows, unpadded, starting on 16-byte boundaries
+
+Bundles live alongside the mappings in the user's config directory, and a
+bundle whose sources have changed since it was compiled is simply rebuilt.
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+
+import pygame
+
+import catalog
+import configurator
+import startup
+
+_MAGIC = 'PADPYGHT'
+_VERSION = 1
+_HEADER = struct.Struct('<8sII')
+_ALIGN = 16
+
+
+def bundle_path(skin_name):
+    return os.path.join(configurator._data_path('bundles'),
+                        '%s.bundle' % skin_name)
+
+
+def _source_files(cfg):
+    names = ['skin.json']
+    names.extend('%s.png' % name for name in cfg.image_names())
+    return names
+
+
+def _source_stats(cfg):
+    stats = dict()
+    for name in _source_files(cfg):
+        st = os.stat(os.path.join(cfg.path, name))
+        stats[name] = [st.st_mtime, st.st_size]
+    return stats
+
+
+def _is_fresh(cfg, sources):
+    try:
+        return _source_stats(cfg) == sources
+    except OSError:
+        return False
+
+
+def _pixels_start(index_size):
+    start = _HEADER.size + index_size
+    return start + (-start % _ALIGN)
+
+
+def _pixel_format(image):
+    if image.get_flags() & pygame.SRCALPHA or image.get_colorkey():
+        return 'RGBA'
+    return 'RGB'
+
+
+def compile_skin(cfg, images=None):
+    """Writes the bundle for an already-parsed skin, decoding its images
+    unless they are given (as a dict of name to surface)."""
+    if images is None:
+        images = dict((name, pygame.image.load(
+            os.path.join(cfg.path, '%s.png' % name)))
+            for name in cfg.image_names())
+
+    index = {'layout': cfg.parsed, 'sources': _source_stats(cfg),
+             'images': dict()}
+    blobs = list()
+    offset = 0
+    for name in cfg.image_names():
+        image = images[name]
+        fmt = _pixel_format(image)
+        data = pygame.image.tostring(image, fmt)
+        offset += -offset % _ALIGN
+        index['images'][name] = [image.get_width(), image.get_height(),
+                                 fmt, offset, len(data)]
+        blobs.append((offset, data))
+        offset += len(data)
+    index_data = json.dumps(index, sort_keys=True)
+
+    path = bundle_path(cfg.name)
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    tmp_path = '%s.tmp' % path
+    base = _pixels_start(len(index_data))
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, len(index_data)))
+        f.write(index_data)
+        for blob_offset, data in blobs:
+            f.seek(base + blob_offset)
+            f.write(data)
+    if sys.platform == 'win32' and os.path.exists(path):
+        os.remove(path)
+    os.rename(tmp_path, path)
+
+
+def load(skin_name):
+    """Maps the skin's bundle, returning its PadConfig and a dict of image
+    name to surface, or None if there is no bundle or it is out of date."""
+    path = bundle_path(skin_name)
+    try:
+        with open(path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (IOError, OSError, ValueError):
+        return None
+
+    try:
+        magic, version, index_size = _HEADER.unpack_from(data)
+        if magic != _MAGIC or version != _VERSION:
+            return None
+        index = json.loads(data[_HEADER.size:_HEADER.size + index_size])
+    except (struct.error, ValueError):
+        return None
+
+    cfg = configurator.PadConfig(skin_name, index['layout'])
+    if not _is_fresh(cfg, index['sources']):
+        return None
+    startup.profile.mark('skin parse')
+
+    base = _pixels_start(index_size)
+    images = dict()
+    for name, (w, h, fmt, offset, size) in index['images'].iteritems():
+        if base + offset + size > len(data):
+            return None
+        # the surfaces keep a reference to their buffers, and through them
+        # the mapping, which stays open for as long as any of them live.
+        images[str(name)] = pygame.image.frombuffer(
+            buffer(data, base + offset, size), (w, h), str(fmt))
+    startup.profile.mark('image decode')
+    return cfg, images
+
+
+def open_skin(skin_name):
+    """Loads a skin from its bundle, falling back to the source files (and
+    writing a fresh bundle from them) if the bundle is missing or stale."""
+    result = load(skin_name)
+    if result is not None:
+        return result
+
+    cfg = catalog.catalog.config(skin_name)
+    startup.profile.mark('skin parse')
+    images = dict((name, pygame.image.load(
+        os.path.join(cfg.path, '%s.png' % name)))
+        for name in cfg.image_names())
+    startup.profile.mark('image decode')
+    try:
+        compile_skin(cfg, images)
+    except (IOError, OSError) as e:
+        print 'Could not write skin bundle for', skin_name, '-', e
+    startup.profile.mark('bundle write')
+    return cfg, images
+
+
+if __name__ == '__main__':
+    for _skin in sys.argv[1:]:
+        compile_skin(configurator.PadConfig(_skin))
+        print 'compiled', _skin, 'to', bundle_path(_skin)
@@ -0,0 +1,188 @@
+"""A persistent catalog of installed skins.
+
+Rather than listing every skin directory and parsing every skin.json each
+time, the catalog keeps what it last found in a small index in the user's
+config directory: each skin's path, the mtime and size of its skin.json,
+its parsed layout and its dimensions.  Refreshing it only lists a skins
+directory whose mtime has changed, and only parses a skin.json that has.
+
+Thumbnails of each skin's background are made the first time they're asked
+for, and kept as small PNGs alongside the index until the background
+changes.
+"""
+
+import json
+import os
+import sys
+
+import pygame
+
+import configurator
+
+_VERSION = 1
+_THUMBNAIL_SIZE = (96, 68)
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime, st.st_size]
+
+
+class SkinCatalog:
+    def __init__(self, path=None):
+        self.path = path or configurator._data_path('catalog')
+        self._index_path = os.path.join(self.path, 'catalog.json')
+        self.roots = dict()
+        self.skins = dict()
+        self._loaded = False
+        self._dirty = False
+
+    def _load(self):
+        self._loaded = True
+        try:
+            with open(self._index_path, 'r') as f:
+                index = json.load(f)
+        except (IOError, OSError, ValueError):
+            return
+        if index.get('version') == _VERSION:
+            self.roots = index.get('roots', dict())
+            self.skins = index.get('skins', dict())
+
+    def save(self):
+        if not self._dirty:
+            return
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+        tmp_path = '%s.tmp' % self._index_path
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': _VERSION, 'roots': self.roots,
+                       'skins': self.skins}, f, sort_keys=True)
+        if sys.platform == 'win32' and os.path.exists(self._index_path):
+            os.remove(self._index_path)
+        os.rename(tmp_path, self._index_path)
+        self._dirty = False
+
+    def _scan_root(self, root):
+        # the directory's own mtime changes whenever a skin is added or
+        # removed, so an unchanged one needn't be listed again.
+        stat = _stat(root)
+        known = self.roots.get(root)
+        if known is not None and stat == known['stat']:
+            return known['skins']
+        names = list()
+        if stat is not None:
+            names = sorted(name for name in os.listdir(root)
+                           if os.path.isdir(os.path.join(root, name)))
+        self.roots[root] = {'stat': stat, 'skins': names}
+        self._dirty = True
+        return names
+
+    def _refresh_skin(self, name, path):
+        cfg_path = os.path.join(path, 'skin.json')
+        stat = _stat(cfg_path)
+        entry = self.skins.get(name)
+        if entry is not None and entry['path'] == path and \
+                entry['stat'] == stat:
+            return entry
+        if stat is None:
+            print 'skin.json missing from', path
+            entry = None
+        else:
+            try:
+                with open(cfg_path, 'r') as f:
+                    layout = json.load(f)
+                cfg = configurator.PadConfig(name, layout, path)
+            except (IOError, ValueError, AssertionError, TypeError) as e:
+                print 'could not read', cfg_path, '-', e
+                layout = None
+            if layout is None:
+                entry = None
+            else:
+                entry = {'path': path, 'stat': stat, 'layout': layout,
+                         'size': cfg.size, 'thumbnail': None}
+        if entry is None:
+            if self.skins.pop(name, None) is None:
+                return None
+        else:
+            self.skins[name] = entry
+        self._dirty = True
+        return entry
+
+    def refresh(self):
+        """Brings the catalog up to date with what's installed, returning
+        the names of every usable skin, in order."""
+        if not self._loaded:
+            self._load()
+        found = dict()
+        # later roots take precedence, so the user's skins can replace the
+        # ones that come with padpyght.
+        for root in configurator.skin_roots():
+            for name in self._scan_root(root):
+                found[name] = os.path.join(root, name)
+        for name in list(self.skins):
+            if name not in found:
+                del self.skins[name]
+                self._dirty = True
+        names = list()
+        for name, path in sorted(found.iteritems()):
+            if self._refresh_skin(name, path) is not None:
+                names.append(name)
+        self.save()
+        return names
+
+    def config(self, name):
+        """The skin's PadConfig, straight from the catalog where its entry is
+        still fresh."""
+        if not self._loaded:
+            self._load()
+        path = configurator.find_skin(name)
+        entry = self._refresh_skin(name, path)
+        self.save()
+        if entry is None:
+            return configurator.PadConfig(name, path=path)
+        return configurator.PadConfig(name, entry['layout'], entry['path'])
+
+    def thumbnail(self, name):
+        """A downscaled copy of the skin's background, as a surface, or None
+        if there's no such skin."""
+        entry = self.skins.get(name)
+        if entry is None:
+            return None
+        cfg = configurator.PadConfig(name, entry['layout'], entry['path'])
+        source = os.path.join(cfg.path, '%s.png' % cfg.background)
+        source_stat = _stat(source)
+        thumbnail_path = os.path.join(self.path, 'thumbnails',
+                                      '%s.png' % name)
+        cached = entry.get('thumbnail')
+        if cached == source_stat and os.path.exists(thumbnail_path):
+            try:
+                return pygame.image.load(thumbnail_path)
+            except pygame.error:
+                pass
+        if source_stat is None:
+            return None
+
+        image = pygame.image.load(source)
+        w, h = image.get_size()
+        factor = min(float(_THUMBNAIL_SIZE[0]) / w,
+                     float(_THUMBNAIL_SIZE[1]) / h)
+        size = (max(1, int(w * factor)), max(1, int(h * factor)))
+        if image.get_bitsize() < 24:
+            # smoothscale only takes 24 and 32-bit surfaces.
+            converted = pygame.Surface(image.get_size(), 0, 32)
+            converted.blit(image, (0, 0))
+            image = converted
+        image = pygame.transform.smoothscale(image, size)
+        if not os.path.exists(os.path.dirname(thumbnail_path)):
+            os.makedirs(os.path.dirname(thumbnail_path))
+        pygame.image.save(image, thumbnail_path)
+        entry['thumbnail'] = source_stat
+        self._dirty = True
+        self.save()
+        return image
+
+
+catalog = SkinCatalog()
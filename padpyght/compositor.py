@@ -0,0 +1,104 @@
+"""Retained-mode drawing for a pad.
+
+A pad is a stack of layers, bottom to top, each of which knows the area it
+could ever draw in (its bounds) and how to draw itself as it is now.  When
+a layer changes, it reports the pixels that actually changed as damage, and
+at the end of the frame every damaged region is drawn again, once, from the
+layers that cover it, bottom to top, with everything else clipped away.
+"""
+
+import pygame
+
+
+def merge_rects(rects):
+    """The rectangles with every overlapping group of them replaced by its
+    bounding box, so that no pixel is covered twice."""
+    merged = list()
+    for rect in rects:
+        i = rect.collidelist(merged)
+        while i != -1:
+            rect = rect.union(merged.pop(i))
+            i = rect.collidelist(merged)
+        merged.append(rect)
+    return merged
+
+
+class SpatialIndex:
+    """Layer bounds bucketed into a uniform grid, so that finding the layers
+    under a rectangle only looks at the cells it touches."""
+
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        self._cells = dict()
+
+    def _cells_for(self, rect):
+        size = self.cell_size
+        for x in xrange(rect.left // size, (rect.right - 1) // size + 1):
+            for y in xrange(rect.top // size, (rect.bottom - 1) // size + 1):
+                yield x, y
+
+    def insert(self, key, rect):
+        if rect.w and rect.h:
+            for cell in self._cells_for(rect):
+                self._cells.setdefault(cell, list()).append((key, rect))
+
+    def query(self, rect):
+        found = set()
+        if rect.w and rect.h:
+            for cell in self._cells_for(rect):
+                for key, bounds in self._cells.get(cell, ()):
+                    if key not in found and bounds.colliderect(rect):
+                        found.add(key)
+        return found
+
+
+class Compositor:
+    """Draws a stack of layers onto target, within rect, redrawing only what
+    has been damaged since the last composite().  A layer is anything with
+    a bounds rect and a draw(target) method."""
+
+    # a profiler.FrameProfiler to report what's drawn to, when profiling.
+    profiler = None
+
+    def __init__(self, target, rect=None):
+        self.target = target
+        self.rect = pygame.Rect(rect or target.get_rect())
+        self.layers = list()
+        self._index = SpatialIndex()
+        self._damage = list()
+
+    def add(self, layer):
+        """Puts a layer on top of those already added."""
+        self._index.insert(len(self.layers), layer.bounds)
+        self.layers.append(layer)
+
+    def damage(self, rect):
+        rect = self.rect.clip(rect)
+        if rect.w and rect.h:
+            self._damage.append(rect)
+
+    def damage_all(self):
+        self.damage(self.rect)
+
+    @property
+    def damaged(self):
+        return bool(self._damage)
+
+    def composite(self):
+        """Redraws the damaged regions, returning how many there were."""
+        if not self._damage:
+            return 0
+        regions = merge_rects(self._damage)
+        self._damage = list()
+        clip = self.target.get_clip()
+        profiler = Compositor.profiler
+        for region in regions:
+            self.target.set_clip(region)
+            layers = [self.layers[z]
+                      for z in sorted(self._index.query(region))]
+            for layer in layers:
+                layer.draw(self.target)
+            if profiler is not None:
+                profiler.composited(region, layers)
+        self.target.set_clip(clip)
+        return len(regions)
@@ -1,7 +1,7 @@
 import collections
+import hashlib
 import json
 import os
-import pkg_resources
 import sys
 
 
@@ -28,15 +28,16 @@ class TriggerConfig(ButtonConfig):
 
 
 class PadConfig:
-    def __init__(self, skin_name):
+    def __init__(self, skin_name, parsed=None, path=None):
         self.name = skin_name
-        self.path = pkg_resources.resource_filename('padpyght',
-                                                    'skins/%s' % skin_name)
+        self.path = path or find_skin(skin_name)
 
-        cfg = os.path.join(self.path, 'skin.json')
-        with open(cfg, 'r') as f:
-            parsed = json.load(f)
+        if parsed is None:
+            cfg = os.path.join(self.path, 'skin.json')
+            with open(cfg, 'r') as f:
+                parsed = json.load(f)
         assert isinstance(parsed, dict)
+        self.parsed = parsed
         general = parsed.get('general', dict())
         assert isinstance(general, dict)
 
@@ -62,17 +63,60 @@ class PadConfig:
         self.triggers = component_parser('triggers', TriggerConfig)
         self.buttons = component_parser('buttons', ButtonConfig)
 
+    def image_names(self):
+        names = [self.background]
+        names.extend(self.buttons)
+        for name, stick in self.sticks.iteritems():
+            names.append(name)
+            if stick.clickable:
+                names.append(name + '-click')
+        names.extend(self.triggers)
+        return names
 
-def _mappings_path():
+
+# where padpyght keeps its own files, if not the platform's usual place.
+data_root = None
+
+
+def _data_path(subdir):
+    if data_root is not None:
+        return os.path.join(data_root, subdir)
     path = os.path.expanduser('~/.config')
     if sys.platform == 'win32':
         path = os.path.expandvars('%AppData%')
     elif sys.platform == 'darwin':
         path = os.path.expanduser('~/Library/Application Support')
-    return os.path.join(path, 'padpyght', 'mappings')
+    return os.path.join(path, 'padpyght', subdir)
+
+
+def _packaged_skins_path():
+    if getattr(sys, 'frozen', False):
+        return os.path.join(sys._MEIPASS, 'padpyght', 'skins')
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'skins')
+
+
+def skin_roots():
+    """The directories skins are found in, in increasing order of
+    precedence: those that come with padpyght, then the user's own."""
+    return [_packaged_skins_path(), _data_path('skins')]
+
+
+def find_skin(skin_name):
+    for root in reversed(skin_roots()):
+        path = os.path.join(root, skin_name)
+        if os.path.isfile(os.path.join(path, 'skin.json')):
+            return path
+    return os.path.join(_packaged_skins_path(), skin_name)
+
+
+def _mappings_path():
+    return _data_path('mappings')
 
 
 def load_mappings(skin):
+    """Reads a whole mappings file in the old format, one per skin, keyed by
+    joystick name.  MappingStore imports these the first time it's asked
+    about their skin."""
     path = _mappings_path()
     map_filename = os.path.join(path, '%s.json' % skin)
     if os.path.exists(map_filename):
@@ -81,10 +125,103 @@ def load_mappings(skin):
     return dict()
 
 
-def save_mappings(skin, data):
-    path = _mappings_path()
-    if not os.path.exists(path):
-        os.makedirs(path)
-    map_filename = os.path.join(path, '%s.json' % skin)
-    with open(map_filename, 'w') as f:
-        json.dump(data, f, indent=2, sort_keys=True)
+def joystick_guid(joy):
+    # only pygame 2 can tell apart different models with the same name.
+    get_guid = getattr(joy, 'get_guid', None)
+    if get_guid is None:
+        return None
+    return get_guid()
+
+
+def _text(key):
+    # pygame names joysticks in bytes, and JSON in unicode.
+    if isinstance(key, str):
+        return key.decode('utf-8', 'replace')
+    return key
+
+
+class MappingStore:
+    """Joystick mappings, one small file per (skin, device) under the
+    mappings directory, so that looking one up reads only that record and
+    saving one rewrites only that record.
+
+    A device is known by its GUID where pygame can give one, and otherwise
+    (or for a recording, or input from the network, which only know the
+    name) by its name.  Records are read the first time they're asked for
+    and then kept, as are misses."""
+
+    def __init__(self, path=None):
+        self.path = path or _mappings_path()
+        self._cache = dict()
+        self._imported = set()
+
+    @staticmethod
+    def _record_name(kind, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+        return '%s-%s.json' % (kind, digest)
+
+    def _record_path(self, skin, kind, key):
+        return os.path.join(self.path, skin, self._record_name(kind, key))
+
+    def _read(self, skin, kind, key):
+        cache_key = (skin, kind, key)
+        if cache_key not in self._cache:
+            mapping = None
+            try:
+                with open(self._record_path(skin, kind, key), 'r') as f:
+                    record = json.load(f)
+                # a digest collision is all but impossible, but cheap to
+                # rule out.
+                if record.get(kind) == key:
+                    mapping = record['mapping']
+            except (IOError, OSError, ValueError, KeyError):
+                pass
+            self._cache[cache_key] = mapping
+        return self._cache[cache_key]
+
+    def _write(self, skin, kind, key, record):
+        path = self._record_path(skin, kind, key)
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        tmp_path = '%s.tmp' % path
+        with open(tmp_path, 'w') as f:
+            json.dump(record, f, indent=2, sort_keys=True)
+        if sys.platform == 'win32' and os.path.exists(path):
+            os.remove(path)
+        os.rename(tmp_path, path)
+        self._cache[(skin, kind, key)] = record['mapping']
+
+    def import_legacy(self, skin):
+        """Copies a skin's old all-in-one mappings file into the store, once;
+        it's left where it was."""
+        if skin in self._imported:
+            return
+        self._imported.add(skin)
+        if os.path.isdir(os.path.join(self.path, skin)):
+            return
+        for name, mapping in load_mappings(skin).iteritems():
+            self.put(skin, name, mapping)
+
+    def get(self, skin, name, guid=None):
+        """The mapping for a device, or None if it hasn't been mapped."""
+        self.import_legacy(skin)
+        name, guid = _text(name), _text(guid)
+        mapping = None
+        if guid:
+            mapping = self._read(skin, 'guid', guid)
+        if mapping is None:
+            mapping = self._read(skin, 'name', name)
+        return mapping
+
+    def put(self, skin, name, mapping, guid=None):
+        """Saves a device's mapping, under its GUID if it has one, and under
+        its name for whenever only the name is known."""
+        name, guid = _text(name), _text(guid)
+        record = {'name': name, 'mapping': mapping}
+        if guid:
+            record['guid'] = guid
+            self._write(skin, 'guid', guid, record)
+        self._write(skin, 'name', name, record)
+
+
+mapping_store = MappingStore()
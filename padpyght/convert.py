@@ -1,6 +1,13 @@
 from ConfigParser import ConfigParser
+import argparse
 import json
+import multiprocessing
 import os
+import sys
+
+import pygame
+
+from padpyght import configurator
 from padpyght import util
 
 
@@ -12,11 +19,14 @@ def strip_ext(path):
     return os.path.splitext(path)[0]
 
 
-def convert_pad_light_ini(skin_ini_path):
+def parse_pad_light_ini(skin_ini_path):
+    """Reads a PadLight skin.ini, returning the equivalent skin.json layout
+    and a dict of each image's name in it to the file it came from."""
     cfg = ConfigParser()
     cfg.read(skin_ini_path)
 
     result = util.recursive_default_dict()
+    files = dict()
 
     data = dict(cfg.items('General'))
     general = result['general']
@@ -24,6 +34,7 @@ def convert_pad_light_ini(skin_ini_path):
     general['background-color'] = integer_list(data['backgroundcolor'])
     general['size'] = [int(data['width']), int(data['height'])]
     general['anti-aliasing'] = bool(int(data.get('aa', 1)))
+    files[general['background']] = data['file_background']
 
     for sec in cfg.sections():
         data = dict(cfg.items(sec))
@@ -34,6 +45,7 @@ def convert_pad_light_ini(skin_ini_path):
             button = result['buttons'][button_name]
             button['position'] = integer_list(data['position'])
             button['size'] = integer_list(data['size'])
+            files[button_name] = data['file_push']
         elif sec[:5] == 'Stick':
             stick_name = strip_ext(data['file_stick'])
             if stick_name in result['sticks']:
@@ -42,21 +54,194 @@ def convert_pad_light_ini(skin_ini_path):
             stick['position'] = integer_list(data['position'])
             stick['size'] = integer_list(data['size'])
             stick['radius'] = int(data['radius'])
+            files[stick_name] = data['file_stick']
             # TODO: clicks
         elif sec[:7] == 'Trigger':
             trigger_name = strip_ext(data['file_trigger'])
             if trigger_name in result['triggers']:
                 raise KeyError('Duplicate key: %s %s' % (sec, trigger_name))
-            trigger = result['sticks'][trigger_name]
+            trigger = result['triggers'][trigger_name]
             trigger['position'] = integer_list(data['position'])
             trigger['size'] = integer_list(data['size'])
             trigger['depth'] = int(data['depth'])
+            files[trigger_name] = data['file_trigger']
             # TODO: clicks
         elif sec != 'General':
             print 'Unrecognized skin.ini section:', sec, data
+    return result, files
+
+
+def convert_pad_light_ini(skin_ini_path):
+    result, _ = parse_pad_light_ini(skin_ini_path)
     with open('%s.json' % strip_ext(skin_ini_path), 'w') as f:
         json.dump(result, f, indent=2, sort_keys=True)
 
 
+def _normalized(image):
+    # every image comes out as 32-bit RGBA, whatever it went in as (PadLight
+    # skins are full of colorkeyed BMPs and paletted PNGs).
+    result = pygame.Surface(image.get_size(), pygame.SRCALPHA, 32)
+    result.blit(image, (0, 0))
+    return result
+
+
+def _trim(image, placed_size, position):
+    """Crops an element's image to its opaque pixels, returning the new image
+    and the position and size that put them in the same place on screen.
+
+    An element is drawn with its top-left at position less half of its
+    placed size (the image's own size, or the declared size for a trigger),
+    and only the declared size's worth of the image is ever drawn."""
+    visible = image.get_rect().clip(pygame.Rect((0, 0), placed_size))
+    bounds = image.subsurface(visible).get_bounding_rect()
+    if not bounds.w or not bounds.h:
+        return None
+    left = position[0] - placed_size[0] // 2 + bounds.x
+    top = position[1] - placed_size[1] // 2 + bounds.y
+    return (image.subsurface(bounds).copy(),
+            [left + bounds.w // 2, top + bounds.h // 2],
+            [bounds.w, bounds.h])
+
+
+def optimize_skin(layout, files, src_dir, dst_dir):
+    """Writes the skin to dst_dir with every image in 32-bit RGBA PNG,
+    trimmed of transparent borders, and the layout adjusted to match.
+    Returns a summary, with a list of problems found along the way."""
+    summary = {'errors': list(), 'warnings': list(), 'bytes_before': 0,
+               'bytes_after': 0, 'area_before': 0, 'area_after': 0}
+    images = dict()
+    for name, filename in files.iteritems():
+        path = os.path.join(src_dir, filename)
+        if not os.path.exists(path):
+            summary['errors'].append('%s is missing' % filename)
+            continue
+        summary['bytes_before'] += os.path.getsize(path)
+        images[name] = _normalized(pygame.image.load(path))
+    if summary['errors']:
+        return summary
+
+    skin_rect = pygame.Rect((0, 0), layout['general']['size'])
+    for kind in ('buttons', 'sticks', 'triggers'):
+        for name, element in layout.get(kind, dict()).iteritems():
+            image = images[name]
+            placed_size = image.get_size()
+            if kind == 'triggers':
+                placed_size = element['size']
+            rect = pygame.Rect((0, 0), placed_size)
+            rect.center = element['position']
+            if kind == 'sticks':
+                rect.inflate_ip(element['radius'] * 2, element['radius'] * 2)
+            elif kind == 'triggers':
+                rect.h += element['depth']
+            if not skin_rect.contains(rect):
+                summary['warnings'].append(
+                    '%s reaches outside the skin at %s' % (name, rect))
+            if image.get_width() < element['size'][0] or \
+                    image.get_height() < element['size'][1]:
+                summary['warnings'].append(
+                    '%s is %dx%d, smaller than its size of %dx%d' % (
+                        (name,) + image.get_size() + tuple(element['size'])))
+
+            area = image.get_rect().clip(
+                pygame.Rect((0, 0), element['size']))
+            summary['area_before'] += area.w * area.h
+            trimmed = _trim(image, placed_size, element['position'])
+            if trimmed is None:
+                summary['warnings'].append('%s is fully transparent' % name)
+                summary['area_after'] += area.w * area.h
+                continue
+            images[name], element['position'], element['size'] = trimmed
+            summary['area_after'] += element['size'][0] * element['size'][1]
+
+    if not os.path.exists(dst_dir):
+        os.makedirs(dst_dir)
+    for name, image in images.iteritems():
+        path = os.path.join(dst_dir, '%s.png' % name)
+        pygame.image.save(image, path)
+        summary['bytes_after'] += os.path.getsize(path)
+    with open(os.path.join(dst_dir, 'skin.json'), 'w') as f:
+        json.dump(layout, f, indent=2, sort_keys=True)
+    return summary
+
+
+def convert_skin(job):
+    """Converts the PadLight skin in one directory; the unit of work handed
+    to each process in the pool."""
+    skin_ini_path, dst_dir = job
+    src_dir = os.path.dirname(skin_ini_path)
+    try:
+        layout, files = parse_pad_light_ini(skin_ini_path)
+        summary = optimize_skin(layout, files, src_dir, dst_dir)
+    except Exception as e:
+        summary = {'errors': ['%s: %s' % (type(e).__name__, e)]}
+    summary['source'] = src_dir
+    summary['destination'] = dst_dir
+    return summary
+
+
+def find_skins(root):
+    """Every skin.ini under root, whatever its case."""
+    for dir_path, dir_names, file_names in os.walk(root):
+        for name in file_names:
+            if name.lower() == 'skin.ini':
+                yield os.path.join(dir_path, name)
+
+
+def _print_summary(summary):
+    name = os.path.basename(os.path.normpath(summary['source']))
+    if summary['errors']:
+        print '%s: failed - %s' % (name, '; '.join(summary['errors']))
+        return
+    saved = summary['bytes_before'] - summary['bytes_after']
+    removed = summary['area_before'] - summary['area_after']
+    print '%s: %d bytes saved (%d -> %d), %d px of blit area removed ' \
+          '(%d -> %d)' % (name, saved, summary['bytes_before'],
+                          summary['bytes_after'], removed,
+                          summary['area_before'], summary['area_after'])
+    for warning in summary['warnings']:
+        print '  warning:', warning
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='padpyght.convert',
+        description='convert a tree of PadLight skins to padpyght skins, '
+                    'in parallel')
+    parser.add_argument('source', help='directory to look for skin.ini '
+                                       'files in, at any depth')
+    parser.add_argument('destination', nargs='?',
+                        default=configurator._data_path('skins'),
+                        help="where to write the converted skins (default: "
+                             "the user's skins directory)")
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='how many skins to convert at once (default: '
+                             'one per CPU)')
+    args = parser.parse_args(argv)
+
+    jobs = list()
+    for skin_ini_path in sorted(find_skins(args.source)):
+        src_dir = os.path.dirname(skin_ini_path)
+        name = os.path.relpath(src_dir, args.source)
+        if name == os.curdir:
+            name = os.path.basename(os.path.abspath(src_dir))
+        jobs.append((skin_ini_path, os.path.join(args.destination,
+                                           name.replace(os.sep, '-'))))
+    if not jobs:
+        print 'No skin.ini files found under', args.source
+        return 1
+
+    pool = multiprocessing.Pool(args.jobs)
+    failures = 0
+    try:
+        for summary in pool.imap_unordered(convert_skin, jobs):
+            _print_summary(summary)
+            failures += bool(summary['errors'])
+    finally:
+        pool.close()
+        pool.join()
+    print 'converted %d of %d skins' % (len(jobs) - failures, len(jobs))
+    return 1 if failures else 0
+
+
 if __name__ == '__main__':
-    convert_pad_light_ini('skins/sfc2/skin.ini')
+    sys.exit(main())
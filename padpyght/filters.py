@@ -0,0 +1,211 @@
+"""Pixel-art scaling filters, vectorized with NumPy.
+
+Each filter takes a region of the frame as a surfarray-style (x, y) array of
+mapped pixels, which can mostly just be compared with one another, and
+returns it scaled up by the filter's factor.  A filter only looks so far
+around each pixel (its margin), so a damaged part of the frame can be
+filtered on its own, given that many pixels of its surroundings.
+
+NumPy is optional; without it, no filters are available.
+"""
+
+import collections
+
+try:
+    import numpy
+    from pygame import surfarray
+except ImportError:
+    numpy = None
+
+
+def available():
+    return numpy is not None
+
+
+def _neighbours(a):
+    # the eight neighbours of every pixel, and the pixel itself, with the
+    # edges of the region repeated outwards.
+    p = numpy.pad(a, 1, 'edge')
+    w, h = a.shape
+
+    def at(dx, dy):
+        return p[1 + dx:1 + dx + w, 1 + dy:1 + dy + h]
+
+    return (at(-1, -1), at(0, -1), at(1, -1),
+            at(-1, 0), at(0, 0), at(1, 0),
+            at(-1, 1), at(0, 1), at(1, 1))
+
+
+def _channels(a, layout):
+    # the colour channels of mapped pixels, each as an array of floats.
+    return [((a & mask) >> shift).astype(numpy.float32)
+            for mask, shift in layout]
+
+
+def _blend(x, y, layout):
+    # the average of two mapped pixels, channel by channel, without
+    # unpacking them: the low bit of each channel is dropped from what's
+    # halved, so that it isn't shifted into the channel below.
+    halves = 0
+    for mask, shift in layout:
+        halves |= mask & ~(mask & -mask)
+    return (x & y) + (((x ^ y) & halves) >> 1)
+
+
+def _interleave(blocks, n, a):
+    # blocks[j][i] goes to column i, row j of each n x n output block.
+    w, h = a.shape
+    out = numpy.empty((w * n, h * n), a.dtype)
+    for j, row in enumerate(blocks):
+        for i, block in enumerate(row):
+            out[i::n, j::n] = block
+    return out
+
+
+def _scale2x(a, layout):
+    A, B, C, D, E, F, G, H, I = _neighbours(a)
+    edge = (B != H) & (D != F)
+    where = numpy.where
+    return _interleave(
+        [[where(edge & (D == B), D, E), where(edge & (B == F), F, E)],
+         [where(edge & (D == H), D, E), where(edge & (H == F), F, E)]],
+        2, a)
+
+
+def _scale3x(a, layout):
+    A, B, C, D, E, F, G, H, I = _neighbours(a)
+    edge = (B != H) & (D != F)
+    db, bf = D == B, B == F
+    dh, hf = D == H, H == F
+    ea, ec = E == A, E == C
+    eg, ei = E == G, E == I
+    where = numpy.where
+    return _interleave(
+        [[where(edge & db, D, E),
+          where(edge & ((db & ~ec) | (bf & ~ea)), B, E),
+          where(edge & bf, F, E)],
+         [where(edge & ((db & ~eg) | (dh & ~ea)), D, E),
+          E,
+          where(edge & ((bf & ~ei) | (hf & ~ec)), F, E)],
+         [where(edge & dh, D, E),
+          where(edge & ((dh & ~ei) | (hf & ~eg)), H, E),
+          where(edge & hf, F, E)]],
+        3, a)
+
+
+def _scale4x(a, layout):
+    return _scale2x(_scale2x(a, layout), layout)
+
+
+def _yuv(a, layout):
+    # colour differences are taken in YUV, brightness counting most.
+    r, g, b = _channels(a, layout)
+    return numpy.array((48 * (0.299 * r + 0.587 * g + 0.114 * b),
+                        7 * (-0.169 * r - 0.331 * g + 0.5 * b),
+                        6 * (0.5 * r - 0.419 * g - 0.081 * b)))
+
+
+# the corners of a pixel, as the directions they're in from its centre.
+_CORNERS = ((-1, -1), (1, -1), (-1, 1), (1, 1))
+
+
+def _around(x, y):
+    # where (x, y) is in a pixel's 5x5 neighbourhood, counted along
+    # columns, taking x as towards each corner in turn and y likewise.
+    return [(sx * x + 2) * 5 + sy * y + 2 for sx, sy in _CORNERS]
+
+
+def _edge(a, layout):
+    # xBR, level 1: at each corner of each pixel E, with F and H the pixels
+    # beside and below that corner, I the one diagonally across it, and
+    # so on as in scale2x (with F4 and H5 two pixels out past F and H, and
+    # I4 and I5 past I on either side), the colour differences along the
+    # two diagonals through the corner are weighed against each other.
+    # where they run along the H-F diagonal more than across it, there's
+    # an edge there, and the corner is blended halfway towards F or H,
+    # whichever is the closer colour.  only corners where E differs from
+    # both F and H can be blended, and those are few, so the rule is only
+    # worked out there.
+    w, h = a.shape
+    p = numpy.pad(a, 2, 'edge')
+    out = _interleave([[a, a], [a, a]], 2, a)
+    left, right = p[1:1 + w, 2:2 + h], p[3:3 + w, 2:2 + h]
+    up, down = p[2:2 + w, 1:1 + h], p[2:2 + w, 3:3 + h]
+    candidates = numpy.flatnonzero(((a != left) | (a != right)) &
+                                   ((a != up) | (a != down)))
+    if not len(candidates):
+        return out
+    xs, ys = numpy.divmod(candidates, h)
+    # each candidate's 5x5 neighbourhood, picked out of the padded frame,
+    # one row per place in it; and then as seen from each corner.
+    offsets = numpy.array([x * (h + 4) + y
+                           for x in xrange(-2, 3) for y in xrange(-2, 3)])
+    window = p.take((xs + 2) * (h + 4) + ys + 2 + offsets[:, None])
+    yuv = _yuv(window, layout)
+    px = dict()
+    colour = dict()
+    for k, (x, y) in dict(
+            E=(0, 0), B=(0, -1), C=(1, -1), D=(-1, 0), F=(1, 0),
+            G=(-1, 1), H=(0, 1), I=(1, 1), F4=(2, 0), H5=(0, 2),
+            I4=(2, 1), I5=(1, 2)).iteritems():
+        px[k] = window[_around(x, y)]
+        colour[k] = yuv[:, _around(x, y)]
+
+    def diff(j, k):
+        return numpy.abs(colour[j] - colour[k]).sum(axis=0)
+
+    e = (diff('E', 'C') + diff('E', 'G') + diff('I', 'F4') +
+         diff('I', 'H5') + 4 * diff('H', 'F'))
+    i = (diff('H', 'D') + diff('H', 'I5') + diff('F', 'I4') +
+         diff('F', 'B') + 4 * diff('E', 'I'))
+    E, F, H = px['E'], px['F'], px['H']
+    # leave alone corners that are part of a finer feature than an edge,
+    # as the full xBR rule does.
+    edge = (E != F) & (E != H) & (e < i) & (
+        (F != px['B']) & (H != px['D']) |
+        (E == px['I']) & (F != px['I4']) & (H != px['I5']) |
+        (E == px['G']) | (E == px['C']))
+    towards = numpy.where(diff('E', 'F') <= diff('E', 'H'), F, H)
+    # each blended corner's place in the output, every pixel having become
+    # two by two.
+    corner, n = numpy.nonzero(edge)
+    sx, sy = numpy.array(_CORNERS).T
+    place = ((2 * xs[n] + (sx[corner] + 1) // 2) * 2 * h +
+             2 * ys[n] + (sy[corner] + 1) // 2)
+    out.put(place, _blend(E[edge], towards[edge], layout))
+    return out
+
+
+def _nearest(a, layout):
+    return a
+
+
+class Filter:
+    def __init__(self, name, factor, margin, apply):
+        self.name = name
+        self.factor = factor
+        self.margin = margin
+        self.apply = apply
+
+    def render(self, source, area, dest):
+        """Filters all of source, and writes the part of the result that
+        came from area of it to dest, which must be the right size and in
+        the same pixel format as source."""
+        layout = zip(source.get_masks()[:3], source.get_shifts()[:3])
+        pixels = self.apply(surfarray.array2d(source), layout)
+        n = self.factor
+        x, y = area.left * n, area.top * n
+        surfarray.blit_array(dest, pixels[x:x + area.w * n,
+                                          y:y + area.h * n])
+
+
+# 'nearest' does no filtering of its own; the frame buffer scales whatever
+# a filter gives it up the rest of the way, to the largest whole multiple of
+# the frame that fits the window, by repeating pixels.
+FILTERS = collections.OrderedDict((f.name, f) for f in (
+    Filter('nearest', 1, 0, _nearest),
+    Filter('scale2x', 2, 1, _scale2x),
+    Filter('scale3x', 3, 1, _scale3x),
+    Filter('scale4x', 4, 2, _scale4x),
+    Filter('edge', 2, 2, _edge),
+))
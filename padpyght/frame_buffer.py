@@ -1,5 +1,31 @@
+import collections
+
 import pygame
 
+import compositor
+
+# the size of the grid that damage is rounded out to in filter mode.
+_FILTER_TILE = 32
+
+
+class DisplayTarget:
+    """Stands in for a native FrameBuffer as something to draw on: blits go
+    straight to the window's target subsurface, and the rectangles they
+    touch are recorded (in window coordinates) for FrameBuffer.update."""
+
+    def __init__(self, fb):
+        self._fb = fb
+        self._surface = fb._target
+        self._offset = self._surface.get_abs_offset()
+
+    def blit(self, *args, **kwargs):
+        r = self._surface.blit(*args, **kwargs)
+        self._fb._update_rectangles.append(r.move(self._offset))
+        return r
+
+    def __getattr__(self, name):
+        return getattr(self._surface, name)
+
 
 class FrameBuffer(pygame.Surface):
     instance = None
@@ -7,9 +33,15 @@ class FrameBuffer(pygame.Surface):
     def __init__(self, display_res, fb_res,
                  flags=pygame.HWSURFACE | pygame.DOUBLEBUF | pygame.RESIZABLE,
                  fps=60, scale_type='pixelperfect', scale_smooth=False,
-                 background_color=(0, 0, 0)):
-        pygame.display.set_mode(display_res, flags)
-        pygame.Surface.__init__(self, fb_res, flags)
+                 background_color=(0, 0, 0), native=False, masks=None,
+                 scale_filter=None, depth=0):
+        # depth 0 takes whatever the display prefers.
+        self._depth = depth
+        pygame.display.set_mode(display_res, flags, depth)
+        if masks is None:
+            pygame.Surface.__init__(self, fb_res, flags, depth or 0)
+        else:
+            pygame.Surface.__init__(self, fb_res, flags, 32, masks)
 
         self._base_size = display_res
         self._scale_factor = 1.0
@@ -18,24 +50,51 @@ class FrameBuffer(pygame.Surface):
         if scale_smooth:
             self._scale_function = pygame.transform.smoothscale
         self.background_color = background_color
+        # with a filter (the 'filter' scale type), the frame is filtered into
+        # a buffer of its own, which is then scaled up to the window by
+        # whatever whole factor is left.  the buffer survives resizing.
+        self._filter = None
+        self._filtered = None
+        self._filter_repeat = 1
+        self._filtered_stale = True
+        # whether the window is too small for the filter, which is then
+        # left out until it's resized to fit.
+        self.filter_skipped = False
+        if scale_filter is not None:
+            import filters
+            self._filter = filters.FILTERS[scale_filter]
+        # in native mode, whatever is drawn is drawn at window resolution
+        # through native_target(), and this surface's own pixels go unused.
+        self._native = native
         self._target = self._compute_target_subsurface()
 
         self._update_rectangles = []
+        self._full_update = True
+        # a profiler.FrameProfiler to time scaling and presenting, if any.
+        self.profiler = None
 
         self._clock = pygame.time.Clock()
         self._fps = fps
         self._lag = 0
         self._t_delta = 0
 
+        self._nominal_fps = fps
+        self._start_ticks = pygame.time.get_ticks()
+        self.frames_presented = 0
+
         if FrameBuffer.instance is None:
             FrameBuffer.instance = self
 
     def handle_event(self, event):
+        # returns whether the target subsurface was recomputed, which in
+        # native mode means everything has to be drawn again at the new size.
         if event.type == pygame.VIDEORESIZE:
             flags = pygame.display.get_surface().get_flags()
-            pygame.display.set_mode(event.size, flags)
+            pygame.display.set_mode(event.size, flags, self._depth)
             self.recompute_target_subsurface()
-        elif event.type == pygame.KEYDOWN:
+            return True
+        elif event.type == pygame.KEYDOWN and event.key in (
+                pygame.K_KP_MINUS, pygame.K_KP_PLUS):
             if event.key == pygame.K_KP_MINUS:
                 self._scale_factor -= 0.1
             elif event.key == pygame.K_KP_PLUS:
@@ -44,12 +103,39 @@ class FrameBuffer(pygame.Surface):
             w, h = self._base_size
             flags = pygame.display.get_surface().get_flags()
             pygame.display.set_mode((int(w * self._scale_factor),
-                                    int(h * self._scale_factor)), flags)
+                                    int(h * self._scale_factor)), flags,
+                                    self._depth)
             self.recompute_target_subsurface()
+            return True
+        return False
 
     def recompute_target_subsurface(self):
         self._target = self._compute_target_subsurface()
-        self.flip(delay=False)
+        if self._native:
+            self._update_rectangles = []
+            self._full_update = True
+        else:
+            self.flip(delay=False)
+
+    def native_target(self):
+        return DisplayTarget(self)
+
+    def scale_factors(self):
+        return (float(self._target.get_width()) / self.get_width(),
+                float(self._target.get_height()) / self.get_height())
+
+    def scale_image(self, surface, size):
+        # scales a sprite the way flip() would scale the whole frame.
+        if surface.get_bitsize() < 24:
+            surface = surface.convert_alpha()
+        if self._scale_type == 'scale2x':
+            w, h = size
+            while surface.get_width() * 2 <= w and \
+                    surface.get_height() * 2 <= h:
+                surface = pygame.transform.scale2x(surface)
+            if surface.get_size() == (w, h):
+                return surface
+        return self._scale_function(surface, size)
 
     def _compute_target_subsurface(self):
         screen = pygame.display.get_surface()
@@ -82,6 +168,29 @@ class FrameBuffer(pygame.Surface):
                 target = screen.subsurface(r)
             else:
                 target = screen
+        elif self._scale_type == 'filter':
+            factor = max(1, min(display_rect.w // self_rect.w,
+                                display_rect.h // self_rect.h))
+            # a filter that doesn't fit the window is left out altogether.
+            n = self._filter.factor
+            self.filter_skipped = factor < n
+            if self.filter_skipped:
+                n = 1
+            self._filter_repeat = factor // n
+            if self._filtered is None or \
+                    self._filtered.get_width() != n * self_rect.w:
+                # in the frame's own pixel format, so filters can copy
+                # mapped pixels across as they are.
+                self._filtered = pygame.Surface(
+                    (n * self_rect.w, n * self_rect.h), 0, self)
+                self._filtered_stale = True
+            factor = n * self._filter_repeat
+            r = pygame.Rect(0, 0, factor * self_rect.w, factor * self_rect.h)
+            r.center = display_rect.center
+            if display_rect.contains(r):
+                target = screen.subsurface(r)
+            else:
+                target = screen
         elif self._scale_type == 'proportional':
             target = screen.subsurface(self_rect.fit(display_rect))
         elif self._scale_type == 'stretch':
@@ -94,34 +203,209 @@ class FrameBuffer(pygame.Surface):
                 target = screen.subsurface(self_rect.fit(display_rect))
         return target
 
+    @property
+    def dirty(self):
+        return self._full_update or bool(self._update_rectangles)
+
     def blit(self, *args, **kwargs):
         self._update_rectangles.append(pygame.Surface.blit(self, *args, **kwargs))
 
     def flip(self, delay=True):
-        if self._scale_type == 'scale2x':
+        if self._native:
+            pass
+        elif self._scale_type == 'scale2x':
             tmp_surf = self
             target_width = self._target.get_width()
             while tmp_surf.get_width() < target_width:
                 tmp_surf = pygame.transform.scale2x(tmp_surf)
             self._target.blit(tmp_surf, (0, 0))
+        elif self._scale_type == 'filter':
+            # only a new filtered buffer needs the whole frame filtered; on
+            # an ordinary resize it's just scaled to the window again.
+            if self._filtered_stale:
+                self._filter_rect(self.get_rect())
+                self._filtered_stale = False
+            self._present_filtered(self._filtered.get_rect())
         else:
             self._scale_function(self, self._target.get_size(), self._target)
+        if self.profiler is not None:
+            self.profiler.lap('scale')
         if delay:
             self.limit_fps(set_caption=False)
+            if self.profiler is not None:
+                self.profiler.lap('limit')
         pygame.display.flip()
+        if self.profiler is not None:
+            self.profiler.lap('present')
+        self.frames_presented += 1
         self._update_rectangles = []
+        self._full_update = False
 
-    def update(self):
+    def update(self, delay=True):
+        # only rescale and present the regions blitted since the last update.
+        # a full flip is still needed whenever the window contents as a whole
+        # are stale (first frame, or after the target has been recomputed).
+        if self._full_update:
+            self.flip(delay)
+            return
+        if self._native:
+            self._update_native(delay)
+            return
+        if self._scale_type == 'scale2x' and self._target.get_parent() is None:
+            # the doubled frame overflows the window, so map nothing partially.
+            self.flip(delay)
+            return
         window_rectangles = []
-        screen = self._target.get_abs_parent()
-        for r in self._update_rectangles:
-            wr = self.rect_fb_to_window(r)
-            tmp_surf = self._scale_function(self.subsurface(r), wr.size)
-            screen.blit(tmp_surf, wr)
-            wr.inflate_ip(4, 4)
+        self_rect = self.get_rect()
+        # every layer drawn over a damaged region records its own blit, so
+        # they're merged back into regions before anything is rescaled.
+        rects = [r.clip(self_rect)
+                 for r in compositor.merge_rects(self._update_rectangles)]
+        rects = [r for r in rects if r.w and r.h]
+        if self._scale_type == 'filter':
+            rects = self._dirty_tiles(rects)
+        for r in rects:
+            if self._scale_type == 'scale2x':
+                wr = self._update_scale2x(r)
+            elif self._scale_type == 'filter':
+                wr = self._present_filtered(self._filter_rect(r))
+            else:
+                wr = self._update_scaled(r)
             window_rectangles.append(wr)
-        pygame.display.update(window_rectangles)
         self._update_rectangles = []
+        if self.profiler is not None:
+            self.profiler.lap('scale')
+        if delay:
+            self.limit_fps(set_caption=False)
+            if self.profiler is not None:
+                self.profiler.lap('limit')
+        if window_rectangles:
+            pygame.display.update(window_rectangles)
+            self.frames_presented += 1
+        if self.profiler is not None:
+            self.profiler.lap('present')
+
+    def mark_presented(self):
+        # for offscreen use, where the frame goes somewhere other than the
+        # window: forget the damage as though it had been presented.
+        self._update_rectangles = []
+        self._full_update = False
+        self.frames_presented += 1
+
+    def _update_native(self, delay):
+        # already drawn at window resolution, so there's nothing to scale.
+        window_rectangles = compositor.merge_rects(self._update_rectangles)
+        self._update_rectangles = []
+        if delay:
+            self.limit_fps(set_caption=False)
+            if self.profiler is not None:
+                self.profiler.lap('limit')
+        if window_rectangles:
+            pygame.display.update(window_rectangles)
+            self.frames_presented += 1
+        if self.profiler is not None:
+            self.profiler.lap('present')
+
+    def _update_scaled(self, r):
+        # grow by a pixel so rounding in rect_fb_to_window can't leave seams.
+        r = r.inflate(2, 2).clip(self.get_rect())
+        screen = self._target.get_abs_parent()
+        wr = self.rect_fb_to_window(r).clip(screen.get_rect())
+        if wr.w and wr.h:
+            self._scale_function(self.subsurface(r), wr.size,
+                                 screen.subsurface(wr))
+        return wr
+
+    def _update_scale2x(self, r):
+        # each scale2x pass looks a pixel to either side, so what a damaged
+        # pixel changes spreads by a pixel a pass, and working that out
+        # looks as far again.  filter that much margin around the damaged
+        # area and copy back only the part that changed.
+        passes = 0
+        while self.get_width() << passes < self._target.get_width():
+            passes += 1
+        r = r.inflate(2 * passes, 2 * passes).clip(self.get_rect())
+        src_rect = r.inflate(2 * passes, 2 * passes).clip(self.get_rect())
+        tmp_surf = self.subsurface(src_rect)
+        for _ in xrange(passes):
+            tmp_surf = pygame.transform.scale2x(tmp_surf)
+        factor = 1 << passes
+        area = pygame.Rect((r.left - src_rect.left) * factor,
+                           (r.top - src_rect.top) * factor,
+                           r.w * factor, r.h * factor)
+        dest = pygame.Rect(r.left * factor, r.top * factor, area.w, area.h)
+        self._target.blit(tmp_surf, dest, area)
+        return dest.move(self._target.get_abs_offset())
+
+    def _dirty_tiles(self, rects):
+        # every region filtered costs a margin and a fixed overhead on top
+        # of its area, so rather than filter every damaged region (and
+        # overlapping ones over and over), the damage is rounded out to
+        # whole tiles and each tile is filtered once.  tiles are gathered
+        # into runs along each row of the grid, and runs spanning the same
+        # columns on consecutive rows are joined.
+        t = _FILTER_TILE
+        rows = collections.defaultdict(set)
+        for r in rects:
+            columns = xrange(r.left // t, (r.right - 1) // t + 1)
+            for row in xrange(r.top // t, (r.bottom - 1) // t + 1):
+                rows[row].update(columns)
+        joined = []
+        growing = dict()
+        next_row = None
+        for row in sorted(rows):
+            if row != next_row:
+                # a gap in the rows ends every run growing down.
+                joined.extend(growing.values())
+                growing = dict()
+            previous, growing = growing, dict()
+            columns = sorted(rows[row])
+            start = columns[0]
+            for i, column in enumerate(columns):
+                if i + 1 < len(columns) and columns[i + 1] == column + 1:
+                    continue
+                run = previous.pop((start, column), None)
+                if run is None:
+                    run = pygame.Rect(start * t, row * t,
+                                      (column + 1 - start) * t, 0)
+                run.h += t
+                growing[(start, column)] = run
+                if i + 1 < len(columns):
+                    start = columns[i + 1]
+            joined.extend(previous.values())
+            next_row = row + 1
+        joined.extend(growing.values())
+        self_rect = self.get_rect()
+        return [r.clip(self_rect) for r in joined]
+
+    def _filter_rect(self, r):
+        # like scale2x, filter a margin around the damaged area, as far as
+        # the filter looks, and only keep the part that was asked for.
+        f = self._filter
+        n = self._filtered.get_width() // self.get_width()
+        dest = pygame.Rect(r.left * n, r.top * n, r.w * n, r.h * n)
+        if n == 1:
+            self._filtered.blit(self, dest, r)
+            return dest
+        src_rect = r.inflate(2 * f.margin, 2 * f.margin).clip(self.get_rect())
+        f.render(self.subsurface(src_rect), r.move(-src_rect.left,
+                                                   -src_rect.top),
+                 self._filtered.subsurface(dest))
+        return dest
+
+    def _present_filtered(self, r):
+        # scales a rectangle of the filtered buffer up the rest of the way,
+        # by repeating pixels, returning where it went in the window.
+        m = self._filter_repeat
+        wr = pygame.Rect(r.left * m, r.top * m, r.w * m, r.h * m)
+        wr = wr.clip(self._target.get_rect())
+        if wr.w and wr.h:
+            if m == 1:
+                self._target.blit(self._filtered, wr, r)
+            else:
+                pygame.transform.scale(self._filtered.subsurface(r), wr.size,
+                                       self._target.subsurface(wr))
+        return wr.move(self._target.get_abs_offset())
 
     def rect_fb_to_window(self, r):
         x_factor = float(self._target.get_width()) / self.get_width()
@@ -174,5 +458,17 @@ class FrameBuffer(pygame.Surface):
         self._t_delta = t_delta
         return t_delta
 
+    def tick(self):
+        # plain frame cap, for loops that don't draw every frame and so would
+        # only confuse the adaptive heuristic in limit_fps.
+        self._t_delta = self._clock.tick(self._fps)
+        return self._t_delta
+
     def time_elapsed(self):
         return self._t_delta
+
+    def frame_counts(self):
+        # frames actually presented vs. frames that would have been presented
+        # drawing unconditionally at the nominal rate for the same wall time.
+        elapsed = pygame.time.get_ticks() - self._start_ticks
+        return self.frames_presented, elapsed * self._nominal_fps // 1000
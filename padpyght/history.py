@@ -0,0 +1,205 @@
+"""A fighting-game style input history, drawn alongside the pad.
+
+Each frame, the pad's state is boiled down to a direction in numpad notation
+(5 is neutral, 6 is right, 2 is down and so on) and the buttons held.  Each
+change of that state is an entry in a fixed-size ring buffer, and the strip
+showing the history scrolls down a row and draws only the new entry, from
+glyphs rendered once, so a frame costs the same however long the session.
+"""
+
+import pygame
+
+import atlas
+
+# what fighting games count in, whatever rate the visualizer draws at.
+FRAME_RATE = 60
+MAX_FRAMES = 999
+
+_DIRECTIONS = ('up', 'down', 'left', 'right')
+_NUMPAD = {(-1, 1): '1', (0, 1): '2', (1, 1): '3',
+           (-1, 0): '4', (0, 0): '5', (1, 0): '6',
+           (-1, -1): '7', (0, -1): '8', (1, -1): '9'}
+# words in element names that say nothing about which button it is.
+_NOISE = ('btn', 'button', 'trig', 'trigger', 'stick')
+# the stick that moves the character, given a choice.
+_PRIMARY_STICKS = ('control', 'left', 'main')
+
+
+def _label(name):
+    words = [word for word in name.split('-') if word.lower() not in _NOISE]
+    return '-'.join(words or [name]).upper()
+
+
+def _primary_stick(sticks):
+    names = sorted(sticks)
+    for name in names:
+        if any(word in name.lower() for word in _PRIMARY_STICKS):
+            return sticks[name]
+    return sticks[names[0]] if names else None
+
+
+class InputHistory:
+    """The last length changes of one pad's state, each as a direction, the
+    labels of the buttons held, and when it started."""
+
+    def __init__(self, pad, length=32, threshold=0.5):
+        self.length = length
+        self.threshold = threshold
+        self.entries = [None] * length
+        # how many entries there have ever been; the newest is at
+        # entries[(count - 1) % length].
+        self.count = 0
+        self._state = None
+        self.bind(pad)
+
+    def bind(self, pad):
+        """Reads from pad from now on, as when it's been rescaled."""
+        self._directions = dict((which, list()) for which in _DIRECTIONS)
+        self._buttons = list()
+        for name, button in sorted(pad.buttons.iteritems()):
+            word = name.lower().split('-')[-1]
+            if word in self._directions:
+                self._directions[word].append(button)
+            else:
+                self._buttons.append((_label(name), button))
+        self._triggers = [(_label(name), trigger) for name, trigger
+                          in sorted(pad.triggers.iteritems())]
+        self._stick = _primary_stick(pad.sticks)
+
+    def _held(self, which):
+        for button in self._directions[which]:
+            if button.pressed:
+                return 1
+        if self._stick is not None:
+            return self._stick.directions[which].value > self.threshold
+        return 0
+
+    def state(self):
+        x = self._held('right') - self._held('left')
+        y = self._held('down') - self._held('up')
+        labels = [label for label, button in self._buttons if button.pressed]
+        labels.extend(label for label, trigger in self._triggers
+                      if trigger.value > self.threshold)
+        return _NUMPAD[(x, y)], tuple(labels)
+
+    def sample(self, now):
+        """Records the pad's state if it's changed, returning whether it
+        had."""
+        state = self.state()
+        if state == self._state:
+            return False
+        self._state = state
+        self.entries[self.count % self.length] = state + (now,)
+        self.count += 1
+        return True
+
+    def frames(self, age, now):
+        """How many frames the entry age entries back was held for, so far
+        as the newest one goes."""
+        start = self.entries[(self.count - 1 - age) % self.length][2]
+        end = now
+        if age:
+            end = self.entries[(self.count - age) % self.length][2]
+        return min(MAX_FRAMES, max(1, int(round((end - start) * FRAME_RATE))))
+
+
+class HistoryStrip:
+    """Draws an InputHistory, newest first, into rect of target.
+
+    The strip is kept in a surface of its own: a new entry scrolls it down
+    by a row, and only the new row (and the now-final frame count of the
+    one before it) is drawn; otherwise only the newest entry's frame count
+    changes, if anything does."""
+
+    def __init__(self, history, target, rect, color=(0, 0, 0),
+                 text_color=(255, 255, 255)):
+        if not pygame.font.get_init():
+            pygame.font.init()
+        self.history = history
+        self.target = target
+        self.rect = pygame.Rect(rect)
+        self.color = color
+        self.text_color = text_color
+        self.row_height = max(1, self.rect.h // history.length)
+        self._font = pygame.font.Font(None, self.row_height + 4)
+        self._glyphs = dict()
+        self._count_width = self._glyph('0').get_width() * 3
+        self._space = self._glyph('0').get_width()
+        self.surface = atlas.display_format(pygame.Surface(self.rect.size))
+        self.surface.fill(color)
+        # a new strip draws whatever the history already holds on its first
+        # update, as though it had all just happened.
+        self._shown = 0
+        self._shown_frames = None
+        self._damage = self.surface.get_rect()
+
+    def _glyph(self, text):
+        glyph = self._glyphs.get(text)
+        if glyph is None:
+            glyph = self._font.render(text, True, self.text_color)
+            self._glyphs[text] = glyph
+        return glyph
+
+    def _row(self, row):
+        return pygame.Rect(0, row * self.row_height, self.rect.w,
+                           self.row_height)
+
+    def _draw_count(self, row, frames):
+        cell = pygame.Rect(0, row * self.row_height, self._count_width,
+                           self.row_height)
+        self.surface.fill(self.color, cell)
+        x = cell.right
+        for digit in reversed(str(frames)):
+            glyph = self._glyph(digit)
+            x -= glyph.get_width()
+            self.surface.blit(glyph, (x, cell.top))
+        return cell
+
+    def _draw_row(self, row, now):
+        # the row-th row down shows the entry that many entries back.
+        direction, labels, _ = self.history.entries[
+            (self.history.count - 1 - row) % self.history.length]
+        rect = self._row(row)
+        self.surface.fill(self.color, rect)
+        self._draw_count(row, self.history.frames(row, now))
+        x = self._count_width + self._space * 2
+        for text in (direction,) + labels:
+            glyph = self._glyph(text)
+            if x >= rect.right:
+                break
+            self.surface.blit(glyph, (x, rect.top))
+            x += glyph.get_width() + self._space
+
+    def _rows(self):
+        return min(self.history.count, self.history.length,
+                   self.rect.h // self.row_height)
+
+    def update(self, now):
+        new = self.history.count - self._shown
+        if new > 0:
+            rows = min(new, self._rows())
+            self.surface.scroll(0, rows * self.row_height)
+            for row in xrange(rows):
+                self._draw_row(row, now)
+            if rows < self._rows():
+                # the entry that was newest has only now stopped counting.
+                self._draw_count(rows, self.history.frames(rows, now))
+            self._shown = self.history.count
+            self._shown_frames = None
+            self._damage = self.surface.get_rect()
+        elif self.history.count:
+            frames = self.history.frames(0, now)
+            if frames != self._shown_frames:
+                self._shown_frames = frames
+                cell = self._draw_count(0, frames)
+                if self._damage is None:
+                    self._damage = cell
+                else:
+                    self._damage = self._damage.union(cell)
+
+    def draw(self):
+        if self._damage is not None:
+            self.target.blit(self.surface,
+                             self._damage.move(self.rect.topleft),
+                             self._damage)
+            self._damage = None
@@ -0,0 +1,101 @@
+"""Input-to-present latency tracking.
+
+An input event's latency is measured from when the visualizer takes it off
+the event queue (pygame doesn't say when it actually arrived) to the end of
+each stage it passes through on its way to the screen: dispatch, drawing,
+and presenting the frame.  Events that end up changing nothing on screen
+aren't counted, since they were never shown at all.
+"""
+
+import bisect
+import collections
+import json
+
+import pygame
+
+STAGES = ('dispatch', 'draw', 'present')
+JOYSTICK_EVENTS = frozenset((pygame.JOYAXISMOTION, pygame.JOYBALLMOTION,
+                             pygame.JOYBUTTONDOWN, pygame.JOYBUTTONUP,
+                             pygame.JOYHATMOTION))
+
+
+class LatencyHistogram:
+    """Latencies in fixed-width bins for the whole session, plus the most
+    recent samples for percentiles over a rolling window."""
+
+    def __init__(self, bin_ms=0.25, max_ms=250.0, window=1000):
+        self.bin_ms = bin_ms
+        self.counts = [0] * (int(max_ms / bin_ms) + 1)
+        self._recent = collections.deque(maxlen=window)
+
+    def add(self, seconds):
+        ms = seconds * 1000
+        self.counts[min(int(ms / self.bin_ms), len(self.counts) - 1)] += 1
+        self._recent.append(ms)
+
+    def recent_percentiles(self, *percents):
+        recent = sorted(self._recent)
+        if not recent:
+            return [None for _ in percents]
+        return [recent[min(len(recent) - 1, int(len(recent) * p / 100.0))]
+                for p in percents]
+
+    def percentiles(self, *percents):
+        # from the bins, so these cover the whole session, to bin precision
+        # (the last bin also holds everything past max_ms).
+        total = sum(self.counts)
+        if not total:
+            return [None for _ in percents]
+        cumulative = list()
+        running = 0
+        for count in self.counts:
+            running += count
+            cumulative.append(running)
+        return [(bisect.bisect_left(cumulative, total * p / 100.0) + 1) *
+                self.bin_ms for p in percents]
+
+    def to_dict(self):
+        p50, p95, p99 = self.percentiles(50, 95, 99)
+        return {'bin_ms': self.bin_ms, 'counts': self.counts,
+                'samples': sum(self.counts), 'p50': p50, 'p95': p95,
+                'p99': p99}
+
+
+class LatencyTracker:
+    def __init__(self):
+        self.histograms = dict((stage, LatencyHistogram())
+                               for stage in STAGES)
+        self._pending = list()
+        self._stage_times = dict()
+
+    def arrived(self, events, now):
+        for event in events:
+            if event.type in JOYSTICK_EVENTS:
+                self._pending.append(now)
+
+    def reached(self, stage, now):
+        self._stage_times[stage] = now
+
+    def presented(self, damaged, now):
+        """Ends the frame, counting its inputs if the frame showed them."""
+        self._stage_times['present'] = now
+        if damaged:
+            for stage in STAGES:
+                histogram = self.histograms[stage]
+                stage_time = self._stage_times.get(stage, now)
+                for arrival in self._pending:
+                    histogram.add(stage_time - arrival)
+        self._pending = list()
+
+    def caption(self):
+        p50, p95, p99 = self.histograms['present'].recent_percentiles(
+            50, 95, 99)
+        if p50 is None:
+            return 'latency: no input yet'
+        return 'latency p50 {:.1f} ms, p95 {:.1f} ms, p99 {:.1f} ms'.format(
+            p50, p95, p99)
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(dict((stage, self.histograms[stage].to_dict())
+                           for stage in STAGES), f, indent=2, sort_keys=True)
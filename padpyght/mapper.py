@@ -1,6 +1,7 @@
 import math
 import pygame
 
+import bundle
 import configurator
 import frame_buffer
 import visualizer
@@ -9,7 +10,7 @@ import util
 
 class PadMapper:
     def __init__(self, skin, joy_index):
-        self.cfg = configurator.PadConfig(skin)
+        self.cfg, preloaded = bundle.open_skin(skin)
 
         self.js = pygame.joystick.Joystick(joy_index)
         self.js.init()
@@ -18,16 +19,33 @@ class PadMapper:
             self.cfg.size, self.cfg.size, scale_smooth=self.cfg.anti_aliasing,
             background_color=self.cfg.background_color)
 
-        self.gfx = visualizer.PadImage(self.cfg, self.fb)
+        self.gfx = visualizer.PadImage(
+            self.cfg, self.fb,
+            visualizer.SkinImages(self.cfg.path, preloaded=preloaded))
+
+        # each axis's [rest, min, max], as seen over the whole mapping.
+        self.calibration = dict()
 
     @staticmethod
     def display_message(msg):
         print msg
         pygame.display.set_caption(msg)
 
+    def sample_rest_positions(self):
+        pygame.event.pump()
+        for axis in xrange(self.js.get_numaxes()):
+            value = self.js.get_axis(axis)
+            self.calibration[axis] = [value, value, value]
+
+    def observe_axis(self, axis, value):
+        limits = self.calibration.setdefault(axis, [value, value, value])
+        limits[1] = min(limits[1], value)
+        limits[2] = max(limits[2], value)
+
     def get_all_mappings(self):
         new_config = util.recursive_default_dict()
         data = new_config[self.js.get_name()]
+        self.sample_rest_positions()
 
         def update_data(output_type, result, target, stick_direction=None):
             input_type = result[0]
@@ -57,6 +75,11 @@ class PadMapper:
         for name in self.cfg.triggers:
             update_data('trigger', self.request_trigger(name), name)
 
+        for axis, (rest, low, high) in self.calibration.iteritems():
+            if str(axis) in data.get('axis', ()) and low < high:
+                data['calibration'][str(axis)] = {'rest': rest, 'min': low,
+                                                  'max': high}
+
         return new_config
 
     def get_next_joy_action(self, element, event_filter=None):
@@ -75,6 +98,7 @@ class PadMapper:
             if event_filter and (event.type not in event_filter):
                 pass
             elif event.type == pygame.JOYAXISMOTION:
+                self.observe_axis(event.axis, event.value)
                 value = round(event.value)
                 if axis_result is None:
                     if resting_position[event.axis] is None:
@@ -149,14 +173,14 @@ class PadMapper:
 
 
 def main(skin, joy_index):
-    all_maps = configurator.load_mappings(skin)
-
-    pygame.display.init()
-    pygame.joystick.init()
-    new_map = PadMapper(skin, joy_index).get_all_mappings()
-    all_maps.update(new_map)
-
-    configurator.save_mappings(skin, all_maps)
+    util.init_sdl()
+    pad_mapper = PadMapper(skin, joy_index)
+    new_map = pad_mapper.get_all_mappings()
+
+    js = pad_mapper.js
+    configurator.mapping_store.put(skin, js.get_name(),
+                                   new_map[js.get_name()],
+                                   configurator.joystick_guid(js))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,371 @@
+"""Joystick input over the network.
+
+A sender reads a joystick on one machine and a receiver on another feeds
+what it read to the visualizer, in place of a local joystick.  Each packet
+is a header followed by a number of items, all little-endian:
+
+    header     4 bytes magic 'PPNI', uint8 version, uint8 kind (delta or
+               full), uint32 sequence number, uint64 microseconds on the
+               sender's monotonic clock, uint16 item count
+    items      uint8 kind, uint8 index, two int16 values, encoded just as in
+               an input recording (see recording.py)
+    name       full frames only: uint8 length, then the joystick's name
+               (UTF-8), so that the receiver can find the right mapping
+
+A delta holds whatever changed since the previous poll.  Every so often
+(and first of all) the sender also sends a full frame holding the state of
+every control, so a receiver that missed some deltas, or started late,
+catches up.  Over UDP, each packet is a datagram; over TCP, each is
+preceded by its uint16 length.
+"""
+
+import argparse
+import os
+import select
+import socket
+import struct
+
+import pygame
+
+import configurator
+import recording
+import scheduler
+import util
+
+_MAGIC = 'PPNI'
+_VERSION = 1
+_HEADER = struct.Struct('<4sBBIQH')
+_ITEM = struct.Struct('<BBhh')
+_LENGTH = struct.Struct('<H')
+_DELTA, _FULL = range(2)
+_MAX_ITEMS = 200  # keeps a packet well under a typical MTU's worth of UDP
+# a full frame from further back than this is a restarted sender's, not a
+# late one.
+_RESET_GAP = 64
+
+DEFAULT_PORT = 7463
+
+
+def parse_address(spec, default_host=''):
+    """Splits 'host:port', ':port' or 'port' into a (host, port) pair."""
+    host, _, port = str(spec).rpartition(':')
+    return host or default_host, int(port or DEFAULT_PORT)
+
+
+def _pack(kind, sequence, items, joy_name=None):
+    parts = [_HEADER.pack(_MAGIC, _VERSION, kind, sequence & 0xffffffff,
+                          int(util.monotonic() * 1000000), len(items))]
+    parts.extend(_ITEM.pack(*item) for item in items)
+    if joy_name is not None:
+        name = configurator._text(joy_name).encode('utf-8')[:255]
+        parts.append(chr(len(name)) + name)
+    return ''.join(parts)
+
+
+def _unpack(data):
+    """Returns (kind, sequence, timestamp, items, name), or None if data
+    isn't a packet this version understands."""
+    try:
+        magic, version, kind, sequence, timestamp, count = \
+            _HEADER.unpack_from(data)
+        if magic != _MAGIC or version != _VERSION:
+            return None
+        offset = _HEADER.size
+        items = list()
+        for _ in xrange(count):
+            items.append(_ITEM.unpack_from(data, offset))
+            offset += _ITEM.size
+        name = None
+        if kind == _FULL and offset < len(data):
+            # a long name may have been cut off partway through a
+            # character.
+            name = data[offset + 1:offset + 1 + ord(data[offset])].decode(
+                'utf-8', 'replace')
+    except (struct.error, IndexError):
+        return None
+    return kind, sequence, timestamp, items, name
+
+
+def _full_state(joy):
+    items = list()
+    for axis in xrange(joy.get_numaxes()):
+        items.append(recording._encode(pygame.event.Event(
+            pygame.JOYAXISMOTION, axis=axis, value=joy.get_axis(axis))))
+    for button in xrange(joy.get_numbuttons()):
+        kind = pygame.JOYBUTTONUP
+        if joy.get_button(button):
+            kind = pygame.JOYBUTTONDOWN
+        items.append(recording._encode(pygame.event.Event(
+            kind, button=button)))
+    for hat in xrange(joy.get_numhats()):
+        items.append(recording._encode(pygame.event.Event(
+            pygame.JOYHATMOTION, hat=hat, value=joy.get_hat(hat))))
+    return items
+
+
+class Sender:
+    """Sends one joystick's input to a receiver, batching each poll's worth
+    of changes into a single delta."""
+
+    def __init__(self, address, joy, tcp=False, full_interval=1.0):
+        self.joy = joy
+        self.full_interval = full_interval
+        self.tcp = tcp
+        self.address = address
+        if tcp:
+            self._connect()
+        else:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._socket.connect(address)
+        self._sequence = 0
+        self._last_full = None
+
+    def _connect(self):
+        self._socket = socket.create_connection(self.address)
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def _send(self, kind, items, joy_name=None):
+        if self.tcp and self._socket is None:
+            if kind != _FULL:
+                # the receiver throws deltas away until it has a full frame.
+                return
+            try:
+                self._connect()
+            except socket.error:
+                # still nobody listening; the next full frame tries again.
+                return
+        # one packet per _MAX_ITEMS items; a full frame's name goes last.
+        for start in xrange(0, max(1, len(items)), _MAX_ITEMS):
+            chunk = items[start:start + _MAX_ITEMS]
+            last = start + _MAX_ITEMS >= len(items)
+            packet = _pack(kind, self._sequence, chunk,
+                           joy_name if last else None)
+            self._sequence += 1
+            if self.tcp:
+                packet = _LENGTH.pack(len(packet)) + packet
+                try:
+                    self._socket.sendall(packet)
+                except socket.error:
+                    # the receiver went away; the next full frame connects
+                    # again.
+                    self._socket.close()
+                    self._socket = None
+                    return
+            else:
+                try:
+                    self._socket.send(packet)
+                except socket.error:
+                    # nobody listening yet; the next full frame will do.
+                    pass
+
+    def send_full(self):
+        self._send(_FULL, _full_state(self.joy), self.joy.get_name())
+        self._last_full = util.monotonic()
+
+    def send_events(self, events):
+        items = list()
+        axes = dict()
+        for event in events:
+            if getattr(event, 'joy', self.joy.get_id()) != self.joy.get_id():
+                continue
+            item = recording._encode(event)
+            if item is None:
+                continue
+            if event.type == pygame.JOYAXISMOTION:
+                # only an axis's latest position this poll is worth sending.
+                if event.axis in axes:
+                    items[axes[event.axis]] = item
+                    continue
+                axes[event.axis] = len(items)
+            items.append(item)
+        if items:
+            self._send(_DELTA, items)
+
+    def poll(self):
+        """Waits for input (or until a full frame is due) and sends it.
+        Returns False once the sender has been asked to quit."""
+        if self._last_full is None:
+            self.send_full()
+        timeout = self._last_full + self.full_interval - util.monotonic()
+        events = scheduler.wait_for_events(min(timeout, 0.1))
+        self.send_events(events)
+        if util.monotonic() - self._last_full >= self.full_interval:
+            self.send_full()
+        return not any(event.type == pygame.QUIT for event in events)
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+
+
+class Receiver:
+    """Takes packets from a sender and turns them back into joystick events,
+    as a stand-in for a local joystick.  Packets that arrive out of order are
+    dropped, and full frames bring the state back in line after any that
+    were lost.  A full frame from well before the last packet taken means
+    the sender started over, and is taken too."""
+
+    def __init__(self, address, tcp=False):
+        self.tcp = tcp
+        self._socket = socket.socket(
+            socket.AF_INET, socket.SOCK_STREAM if tcp else socket.SOCK_DGRAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind(address)
+        if tcp:
+            self._socket.listen(1)
+        self._socket.setblocking(False)
+        self._connection = None
+        self._stream = ''
+        self._backlog = list()
+        self.joy_name = None
+        self._sequence = None
+        self.lost = 0
+        self._axes = dict()
+        self._buttons = dict()
+        self._hats = dict()
+
+    @property
+    def address(self):
+        return self._socket.getsockname()
+
+    def _readable(self):
+        if self.tcp and self._connection is not None:
+            return self._connection
+        return self._socket
+
+    def wait(self, timeout):
+        """Blocks until a packet arrives or timeout seconds pass."""
+        try:
+            select.select([self._readable()], [], [], max(0, timeout))
+        except select.error:
+            pass
+
+    def wait_for_name(self, timeout=None):
+        """Waits for the first full frame, which names the joystick."""
+        end = None if timeout is None else util.monotonic() + timeout
+        while self.joy_name is None:
+            if end is not None and util.monotonic() >= end:
+                break
+            self.wait(0.1 if end is None else min(0.1, end - util.monotonic()))
+            # held on to, so the state they bring isn't lost.
+            self._backlog.extend(self.poll())
+        return self.joy_name
+
+    def _packets(self):
+        if not self.tcp:
+            while True:
+                try:
+                    yield self._socket.recv(65535)
+                except socket.error:
+                    return
+        if self._connection is None:
+            try:
+                self._connection, _ = self._socket.accept()
+            except socket.error:
+                return
+            self._connection.setblocking(False)
+            self._stream = ''
+        while True:
+            try:
+                data = self._connection.recv(65535)
+            except socket.error:
+                break
+            if not data:
+                # the sender went away; wait for it to connect again.
+                self._connection.close()
+                self._connection = None
+                self._sequence = None
+                break
+            self._stream += data
+        while len(self._stream) >= _LENGTH.size:
+            size, = _LENGTH.unpack_from(self._stream)
+            if len(self._stream) < _LENGTH.size + size:
+                break
+            yield self._stream[_LENGTH.size:_LENGTH.size + size]
+            self._stream = self._stream[_LENGTH.size + size:]
+
+    def _apply(self, item, full):
+        event = recording._decode(*item)
+        kind = event.type
+        if kind == pygame.JOYAXISMOTION:
+            state, key, value = self._axes, event.axis, event.value
+        elif kind == pygame.JOYHATMOTION:
+            state, key, value = self._hats, event.hat, tuple(event.value)
+        else:
+            state, key = self._buttons, event.button
+            value = kind == pygame.JOYBUTTONDOWN
+        # a full frame only makes events for what it puts right, while a
+        # delta's button presses go through as they are, taps and all.
+        if state.get(key) == value and (full or kind == pygame.JOYAXISMOTION):
+            return None
+        state[key] = value
+        return event
+
+    def poll(self):
+        """Returns the events from every packet that has arrived."""
+        events, self._backlog = self._backlog, list()
+        for data in self._packets():
+            packet = _unpack(data)
+            if packet is None:
+                continue
+            kind, sequence, timestamp, items, name = packet
+            if self._sequence is not None:
+                # how many packets were skipped to get here; anything late
+                # or duplicated comes out as a huge number.
+                gap = (sequence - self._sequence - 1) & 0xffffffff
+                if gap < 0x7fffffff:
+                    self.lost += gap
+                elif kind != _FULL or 0xffffffff - gap < _RESET_GAP:
+                    # late, or a restart too recent to tell from late; a
+                    # stale full frame would only roll the state back.
+                    continue
+            elif kind != _FULL:
+                continue
+            if kind == _FULL:
+                self.joy_name = name or self.joy_name
+            self._sequence = sequence
+            for item in items:
+                event = self._apply(item, kind == _FULL)
+                if event is not None:
+                    events.append(event)
+        return events
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+        self._socket.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='padpyght.netinput',
+        description="send a joystick's input to a visualizer started with "
+                    '--listen on another machine')
+    parser.add_argument('address', help='[host:]port to send to')
+    parser.add_argument('joy_index', nargs='?', type=int, default=0)
+    parser.add_argument('--tcp', action='store_true',
+                        help='send over TCP instead of UDP')
+    parser.add_argument('--full-interval', type=float, default=1.0,
+                        help='seconds between full state frames (default: 1)')
+    args = parser.parse_args(argv)
+
+    # the joystick only sends events with video initialized, but there's
+    # nothing to show.
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.display.init()
+    pygame.joystick.init()
+    joy = pygame.joystick.Joystick(args.joy_index)
+    joy.init()
+    sender = Sender(parse_address(args.address, 'localhost'), joy, args.tcp,
+                    args.full_interval)
+    print 'sending', joy.get_name(), 'to', args.address
+    try:
+        while sender.poll():
+            pass
+    except KeyboardInterrupt:
+        pass
+    sender.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""Where each frame's time goes, phase by phase.
+
+The visualizer's main loop, the frame buffer and the compositors call lap()
+at the end of each phase of a frame, which charges the time since the last
+lap to that phase.  Nothing is timed or counted unless a profiler has been
+attached (with --profile, or the first time the HUD is shown); until then,
+each of those places costs one check for None a frame.
+"""
+
+import csv
+
+import pygame
+
+import util
+
+# waiting for input (or the next deadline), handling it, drawing the pads,
+# scaling the frame buffer to the window, sleeping to cap the frame rate,
+# and handing the frame to the display.
+PHASES = ('wait', 'events', 'draw', 'scale', 'limit', 'present')
+COUNTERS = ('regions', 'blits', 'area')
+_HUD_INTERVAL = 0.5
+
+
+class FrameProfiler:
+    def __init__(self, csv_path=None):
+        self.frames = 0
+        self._start = util.monotonic()
+        self._mark = self._start
+        self._times = dict.fromkeys(PHASES, 0.0)
+        self._counts = dict.fromkeys(COUNTERS, 0)
+        # totals since the HUD last looked, for its averages.
+        self._hud_times = dict.fromkeys(PHASES, 0.0)
+        self._hud_counts = dict.fromkeys(COUNTERS, 0)
+        self._hud_frames = 0
+        self._file = None
+        self._writer = None
+        if csv_path is not None:
+            self._file = open(csv_path, 'wb')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(['frame', 'time'] +
+                                  ['%s_ms' % phase for phase in PHASES] +
+                                  ['total_ms'] + list(COUNTERS))
+
+    def begin_frame(self):
+        self._mark = util.monotonic()
+
+    def lap(self, phase):
+        now = util.monotonic()
+        self._times[phase] += now - self._mark
+        self._mark = now
+
+    def composited(self, region, layers):
+        """Counts a compositor drawing layers over one damaged region: one
+        blit per layer, of as much of it as falls in the region."""
+        self._counts['regions'] += 1
+        self._counts['blits'] += len(layers)
+        for layer in layers:
+            area = layer.bounds.clip(region)
+            self._counts['area'] += area.w * area.h
+
+    def end_frame(self):
+        times = self._times
+        counts = self._counts
+        if self._writer is not None:
+            self._writer.writerow(
+                [self.frames, '%.6f' % (self._mark - self._start)] +
+                ['%.3f' % (times[phase] * 1000) for phase in PHASES] +
+                ['%.3f' % (sum(times.itervalues()) * 1000)] +
+                [counts[counter] for counter in COUNTERS])
+        for phase in PHASES:
+            self._hud_times[phase] += times[phase]
+            times[phase] = 0.0
+        for counter in COUNTERS:
+            self._hud_counts[counter] += counts[counter]
+            counts[counter] = 0
+        self._hud_frames += 1
+        self.frames += 1
+
+    def summary(self):
+        """Average time per phase and counts per frame since the last
+        summary, as lines of text."""
+        frames = self._hud_frames or 1
+        total = sum(self._hud_times.itervalues()) / frames
+        lines = ['frame %7.2f ms %5.0f fps' % (
+            total * 1000, 1 / total if total else 0)]
+        for phase in PHASES:
+            lines.append('%-7s %6.2f ms' % (
+                phase, self._hud_times[phase] * 1000 / frames))
+            self._hud_times[phase] = 0.0
+        lines.append('%d regions %d blits %d px' % tuple(
+            self._hud_counts[counter] // frames for counter in COUNTERS))
+        self._hud_counts = dict.fromkeys(COUNTERS, 0)
+        self._hud_frames = 0
+        return lines
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._writer = None
+
+
+class HudLayer:
+    """A compositor layer in the top left of a pad showing the profiler's
+    summary, refreshed a couple of times a second while it's visible."""
+
+    def __init__(self, compositor):
+        if not pygame.font.get_init():
+            pygame.font.init()
+        self.compositor = compositor
+        line_height = max(10, compositor.rect.h // 40)
+        self._font = pygame.font.Font(None, line_height)
+        self.bounds = pygame.Rect(
+            compositor.rect.topleft,
+            (self._font.size('x' * 26)[0],
+             self._font.get_linesize() * (len(PHASES) + 2))).clip(
+            compositor.rect)
+        self.visible = False
+        self.image = None
+        self._last_refresh = None
+        compositor.add(self)
+
+    def show(self, visible):
+        self.visible = visible
+        self._last_refresh = None
+        if not visible:
+            self.image = None
+            self.compositor.damage(self.bounds)
+
+    def refresh(self, profiler, now):
+        if not self.visible or self._last_refresh is not None and \
+                now - self._last_refresh < _HUD_INTERVAL:
+            return
+        self._last_refresh = now
+        self.image = pygame.Surface(self.bounds.size)
+        line_height = self._font.get_linesize()
+        for i, line in enumerate(profiler.summary()):
+            self.image.blit(self._font.render(line, True, (255, 255, 255)),
+                            (2, i * line_height))
+        self.compositor.damage(self.bounds)
+
+    def draw(self, target):
+        if self.image is not None:
+            target.blit(self.image, self.bounds)
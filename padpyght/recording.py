@@ -0,0 +1,119 @@
+"""Binary recordings of joystick input, and their replay.
+
+A recording is a header followed by fixed-size records, all little-endian:
+
+    header     8 bytes magic 'PADINPUT', uint32 version, uint32 name length,
+               then the joystick's name (UTF-8), so that a replay can find
+               the right mapping without the joystick being present
+    records    uint64 microseconds since recording started, uint8 kind,
+               uint8 index (button, axis or hat number), two int16 values:
+               the axis position scaled to +-32767, 0/1 for a button, or a
+               hat's x and y
+"""
+
+import struct
+
+import pygame
+
+import configurator
+import util
+
+_MAGIC = 'PADINPUT'
+_VERSION = 1
+_HEADER = struct.Struct('<8sII')
+RECORD = struct.Struct('<QBBhh')
+
+_BUTTON_UP, _BUTTON_DOWN, _AXIS, _HAT = range(4)
+_AXIS_SCALE = 32767
+
+
+def _encode(event):
+    if event.type == pygame.JOYAXISMOTION:
+        value = int(round(event.value * _AXIS_SCALE))
+        return _AXIS, event.axis, max(-_AXIS_SCALE - 1, min(_AXIS_SCALE,
+                                                            value)), 0
+    elif event.type == pygame.JOYBUTTONDOWN:
+        return _BUTTON_DOWN, event.button, 1, 0
+    elif event.type == pygame.JOYBUTTONUP:
+        return _BUTTON_UP, event.button, 0, 0
+    elif event.type == pygame.JOYHATMOTION:
+        x, y = event.value
+        return _HAT, event.hat, x, y
+    return None
+
+
+def _decode(kind, index, value0, value1):
+    if kind == _AXIS:
+        return pygame.event.Event(pygame.JOYAXISMOTION, joy=0, axis=index,
+                                  value=float(value0) / _AXIS_SCALE)
+    elif kind == _BUTTON_DOWN:
+        return pygame.event.Event(pygame.JOYBUTTONDOWN, joy=0, button=index)
+    elif kind == _BUTTON_UP:
+        return pygame.event.Event(pygame.JOYBUTTONUP, joy=0, button=index)
+    elif kind == _HAT:
+        return pygame.event.Event(pygame.JOYHATMOTION, joy=0, hat=index,
+                                  value=(value0, value1))
+    raise ValueError('Unknown record kind: %d' % kind)
+
+
+class Recorder:
+    def __init__(self, path, joy_name):
+        self._file = open(path, 'wb')
+        name = configurator._text(joy_name).encode('utf-8')
+        self._file.write(_HEADER.pack(_MAGIC, _VERSION, len(name)))
+        self._file.write(name)
+        self._start = util.monotonic()
+
+    def record(self, event, timestamp=None):
+        """Appends a joystick event; anything else is ignored."""
+        fields = _encode(event)
+        if fields is not None:
+            if timestamp is None:
+                timestamp = util.monotonic()
+            elapsed = max(0, int((timestamp - self._start) * 1000000))
+            self._file.write(RECORD.pack(elapsed, *fields))
+
+    def close(self):
+        self._file.close()
+
+
+class Replay:
+    """Plays a recording back as pygame events, on a clock that the caller
+    advances: by real elapsed time (times some speed) to reproduce the
+    session as it happened, or by a fixed step per frame to push it through
+    as fast as the render loop will go."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, name_size = _HEADER.unpack_from(data)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError('%s is not a padpyght input recording' % path)
+        self.joy_name = data[_HEADER.size:_HEADER.size + name_size].decode(
+            'utf-8')
+        self._data = data
+        self._offset = _HEADER.size + name_size
+        self._clock = 0
+        self._next_time = None
+        self._peek()
+
+    def _peek(self):
+        if self._offset + RECORD.size <= len(self._data):
+            self._next_time = RECORD.unpack_from(self._data, self._offset)[0]
+        else:
+            self._next_time = None
+
+    @property
+    def finished(self):
+        return self._next_time is None
+
+    def advance(self, seconds):
+        """Moves the replay clock forward and returns the events now due."""
+        self._clock += int(seconds * 1000000)
+        events = list()
+        while self._next_time is not None and self._next_time <= self._clock:
+            fields = RECORD.unpack_from(self._data, self._offset)
+            events.append(_decode(*fields[1:]))
+            self._offset += RECORD.size
+            self._peek()
+        return events
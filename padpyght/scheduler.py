@@ -0,0 +1,93 @@
+import collections
+import time
+
+import pygame
+
+import util
+
+POLICIES = ('deadline', 'lowlatency', 'adaptive')
+
+# pygame 2's event.wait takes a timeout; pygame 1.9's blocks indefinitely.
+_WAIT_TAKES_TIMEOUT = pygame.version.vernum[0] >= 2
+
+
+def wait_for_events(timeout):
+    """Blocks until some event is queued or timeout seconds pass, and returns
+    whatever is queued by then (possibly nothing)."""
+    events = list()
+    if timeout > 0:
+        if _WAIT_TAKES_TIMEOUT:
+            event = pygame.event.wait(int(timeout * 1000))
+            if event.type != pygame.NOEVENT:
+                events.append(event)
+        else:
+            end = util.monotonic() + timeout
+            while not pygame.event.peek() and util.monotonic() < end:
+                time.sleep(0.001)
+    events.extend(pygame.event.get())
+    return events
+
+
+class FrameScheduler:
+    """Paces the visualizer against frame deadlines, rather than sleeping in
+    Clock.tick before every present the way FrameBuffer.limit_fps does.
+
+    It keeps a running estimate of how long a frame takes to draw and
+    present, and sleeps until just that long before the next deadline, so
+    input is picked up as late as possible and a damaged frame is presented
+    as soon as it's drawn.  A deadline that's missed is skipped rather than
+    made up for, so a slow frame costs one frame and not a lower frame rate.
+
+    The 'lowlatency' policy also wakes up for input while it sleeps, so a
+    change is presented immediately instead of at the next deadline."""
+
+    def __init__(self, fps=60, policy='deadline'):
+        assert policy in ('deadline', 'lowlatency')
+        self.policy = policy
+        self.frame_time = 1.0 / fps
+        self.budget = 0.0
+        self._deviation = 0.0
+        self._deadline = util.monotonic() + self.frame_time
+        self._work_start = util.monotonic()
+        self._scheduled = False
+        self._presents = collections.deque()
+
+    def _wake_time(self):
+        # a couple of deviations of slack keeps most frames on time.
+        return self._deadline - (self.budget + 2 * self._deviation)
+
+    def wait(self):
+        """Sleeps until it's time to start on a frame, returning the events
+        that arrived in the meantime."""
+        timeout = self._wake_time() - util.monotonic()
+        if self.policy == 'lowlatency':
+            events = wait_for_events(timeout)
+        else:
+            if timeout > 0:
+                time.sleep(timeout)
+            events = pygame.event.get()
+        self._work_start = util.monotonic()
+        # as opposed to woken early by input, in which case this frame is
+        # extra and the deadline still stands.
+        self._scheduled = self._work_start >= self._wake_time()
+        return events
+
+    def frame_done(self, presented):
+        now = util.monotonic()
+        if presented:
+            elapsed = now - self._work_start
+            self._deviation += (abs(elapsed - self.budget) -
+                                self._deviation) / 8
+            self.budget += (elapsed - self.budget) / 8
+            self._presents.append(now)
+        while self._presents and now - self._presents[0] > 1.0:
+            self._presents.popleft()
+        if self._scheduled:
+            self._deadline += self.frame_time
+        if now >= self._deadline:
+            missed = int((now - self._deadline) / self.frame_time)
+            self._deadline += (missed + 1) * self.frame_time
+
+    def caption(self):
+        return '{} fps, budget {:.1f} ms ({})'.format(
+            len(self._presents), self.budget * 1000, self.policy)
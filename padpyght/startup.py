@@ -0,0 +1,41 @@
+"""Where the time goes between starting padpyght and its first frame.
+
+Each phase of startup calls mark() as it finishes, which charges the time
+since the previous mark to that phase.  Marks cost next to nothing, so
+they're always made; --profile-startup just prints them once the first
+frame is up.
+"""
+
+import util
+
+
+class StartupProfile:
+    def __init__(self):
+        self.enabled = False
+        self.phases = list()
+        self._times = dict()
+        self._start = self._last = util.monotonic()
+        self._reported = False
+
+    def mark(self, phase):
+        now = util.monotonic()
+        if phase not in self._times:
+            self.phases.append(phase)
+            self._times[phase] = 0.0
+        self._times[phase] += now - self._last
+        self._last = now
+
+    def report(self):
+        """Prints the breakdown, once, if it was asked for."""
+        if not self.enabled or self._reported:
+            return
+        self._reported = True
+        total = self._last - self._start
+        print 'startup: %.1f ms' % (total * 1000)
+        for phase in self.phases:
+            elapsed = self._times[phase]
+            print '  %-14s %8.1f ms %5.1f%%' % (
+                phase, elapsed * 1000, 100 * elapsed / (total or 1))
+
+
+profile = StartupProfile()
@@ -0,0 +1,184 @@
+"""Stick heatmaps and press counts over a session, kept in NumPy arrays.
+
+Each frame, every stick's position goes into a 2D histogram of where it's
+been, and every button, trigger and stick click that's gone down since the
+last frame is counted.  Sampling per frame rather than per event leaves the
+input path alone, weights each position by how long it was held, and costs
+the same however many events a frame had.
+
+Alongside the whole session's counts, each stick has a heatmap of recent
+use that fades with a half-life.  Rather than multiplying the whole array
+down every frame, each new sample is added with a weight that grows over
+time, and the array is only divided back down (all at once) now and then.
+
+NumPy is optional; without it, there are no statistics.
+"""
+
+import pygame
+
+try:
+    import numpy
+    import pygame.surfarray
+except ImportError:
+    numpy = None
+
+
+def available():
+    return numpy is not None
+
+
+# divide the recent heatmap's weights back down before they get this large.
+_RENORMALIZE_AT = 2.0 ** 64
+_OVERLAY_ALPHA = 160
+
+
+class StickHeatmap:
+    def __init__(self, bins, half_life):
+        self.bins = bins
+        self.half_life = half_life
+        self.counts = numpy.zeros((bins, bins), numpy.int64)
+        self.recent = numpy.zeros((bins, bins), numpy.float64)
+        self._epoch = None
+        self._weight = 1.0
+
+    def add(self, x, y, now):
+        """Counts the stick at (x, y), each from -1 to 1, with y down."""
+        i = int((x + 1) * 0.5 * (self.bins - 1) + 0.5)
+        j = int((y + 1) * 0.5 * (self.bins - 1) + 0.5)
+        self.counts[i, j] += 1
+        if self.half_life:
+            if self._epoch is None:
+                self._epoch = now
+            self._weight = 2.0 ** ((now - self._epoch) / self.half_life)
+            if self._weight > _RENORMALIZE_AT:
+                self.recent /= self._weight
+                self._epoch = now
+                self._weight = 1.0
+        self.recent[i, j] += self._weight
+
+    def decayed(self):
+        """The recent heatmap, as it stands now."""
+        return self.recent / self._weight
+
+
+class HeatmapOverlay:
+    """A compositor layer that shows a stick's recent heatmap over the area
+    it moves in."""
+
+    def __init__(self, compositor, stick, heatmap):
+        self.compositor = compositor
+        self.bounds = stick.bounds
+        self.heatmap = heatmap
+        self.image = None
+        compositor.add(self)
+
+    def refresh(self):
+        heat = self.heatmap.decayed()
+        peak = heat.max()
+        if not peak:
+            return
+        heat = heat / peak
+        small = pygame.Surface(heat.shape, pygame.SRCALPHA, 32)
+        # hot is red, cooler is more yellow, and cold is clear.
+        rgb = pygame.surfarray.pixels3d(small)
+        rgb[..., 0] = 255
+        rgb[..., 1] = (255 * (1 - heat)).astype(numpy.uint8)
+        rgb[..., 2] = 0
+        del rgb
+        alpha = pygame.surfarray.pixels_alpha(small)
+        alpha[...] = (_OVERLAY_ALPHA * numpy.sqrt(heat)).astype(numpy.uint8)
+        del alpha
+        self.image = pygame.transform.smoothscale(small, self.bounds.size)
+        self.compositor.damage(self.bounds)
+
+    def draw(self, target):
+        if self.image is not None:
+            target.blit(self.image, self.bounds)
+
+
+class SessionStats:
+    """Statistics for every pad, sampled once a frame."""
+
+    def __init__(self, pads, bins=32, half_life=10.0, overlay=False,
+                 overlay_interval=0.25):
+        self.bins = bins
+        self.half_life = half_life
+        self.overlay = overlay
+        self.overlay_interval = overlay_interval
+        self.heatmaps = list()
+        self.names = list()
+        self.presses = list()
+        self._last_overlay = None
+        self.bind(pads)
+
+    def bind(self, pads):
+        """Samples pads from now on, keeping what's been counted so far, as
+        when they've been rescaled."""
+        self._sticks = list()
+        self._pressables = list()
+        self.overlays = list()
+        for index, pad in enumerate(pads):
+            if index == len(self.heatmaps):
+                self.heatmaps.append(dict(
+                    (name, StickHeatmap(self.bins, self.half_life))
+                    for name in pad.sticks))
+                self.names.append(sorted(pad.buttons) + sorted(pad.triggers) +
+                                  ['%s-click' % name
+                                   for name in sorted(pad.sticks)])
+                self.presses.append(numpy.zeros(len(self.names[-1]),
+                                                numpy.int64))
+            for name, stick in pad.sticks.iteritems():
+                heatmap = self.heatmaps[index][name]
+                self._sticks.append((stick.directions, heatmap))
+                if self.overlay:
+                    self.overlays.append(HeatmapOverlay(
+                        pad.compositor, stick, heatmap))
+            elements = [pad.buttons[name] for name in sorted(pad.buttons)]
+            elements.extend(pad.triggers[name]
+                            for name in sorted(pad.triggers))
+            elements.extend(pad.sticks[name] for name in sorted(pad.sticks))
+            self._pressables.append((elements, self.presses[index],
+                                     [self._is_down(element)
+                                      for element in elements]))
+        self._last_overlay = None
+
+    @staticmethod
+    def _is_down(element):
+        return getattr(element, 'value', element.pressed) > 0.5
+
+    def sample(self, now):
+        for directions, heatmap in self._sticks:
+            x = directions['right'].value - directions['left'].value
+            y = directions['down'].value - directions['up'].value
+            dist = ((x * x) + (y * y)) ** .5
+            if dist > 1.0:
+                x /= dist
+                y /= dist
+            heatmap.add(x, y, now)
+        for elements, presses, down in self._pressables:
+            for i, element in enumerate(elements):
+                is_down = self._is_down(element)
+                if is_down and not down[i]:
+                    presses[i] += 1
+                down[i] = is_down
+        # the overlays only follow the heatmaps a few times a second.
+        if self.overlays and (self._last_overlay is None or
+                              now - self._last_overlay >=
+                              self.overlay_interval):
+            self._last_overlay = now
+            for overlay in self.overlays:
+                overlay.refresh()
+
+    def save(self, path):
+        """Writes every array to path, as a NumPy .npz file."""
+        arrays = dict()
+        for index, heatmaps in enumerate(self.heatmaps):
+            for name, heatmap in heatmaps.iteritems():
+                prefix = 'pad%d/%s/' % (index, name)
+                arrays[prefix + 'counts'] = heatmap.counts
+                arrays[prefix + 'recent'] = heatmap.decayed()
+            arrays['pad%d/press_names' % index] = numpy.array(
+                self.names[index])
+            arrays['pad%d/presses' % index] = self.presses[index]
+        with open(path, 'wb') as f:
+            numpy.savez(f, **arrays)
@@ -0,0 +1,69 @@
+"""Raw frame output for capture pipelines.
+
+Each frame is written as a small header followed by the frame's pixels,
+straight out of the surface's buffer:
+
+    magic      4 bytes, 'PPFR'
+    width      uint32, pixels
+    height     uint32, pixels
+    pitch      uint32, bytes per row of pixel data that follows
+    timestamp  uint64, microseconds on a monotonic clock
+    pixels     height * pitch bytes, each pixel R, G, B, A in that order
+
+All integers are little-endian.  Without headers, the output is plain
+rawvideo that ffmpeg can read with ``-f rawvideo -pix_fmt rgba``.
+"""
+
+import os
+import struct
+import sys
+
+import util
+
+HEADER = struct.Struct('<4sIIIQ')
+
+if sys.byteorder == 'little':
+    RGBA_MASKS = (0x000000ff, 0x0000ff00, 0x00ff0000, 0xff000000)
+else:
+    RGBA_MASKS = (0xff000000, 0x00ff0000, 0x0000ff00, 0x000000ff)
+
+
+def open_output(spec):
+    """Opens '-' (stdout), a file descriptor number, or a path, unbuffered.
+    Taking over stdout moves it to stderr, so that stray prints can't end
+    up in the middle of a frame."""
+    if spec == '-':
+        fd = os.dup(sys.stdout.fileno())
+        sys.stdout.flush()
+        os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+        return os.fdopen(fd, 'wb', 0)
+    if spec.isdigit():
+        return os.fdopen(int(spec), 'wb', 0)
+    return open(spec, 'wb', 0)
+
+
+class FrameWriter:
+    def __init__(self, output, header=True):
+        self.output = output
+        self.header = header
+        self.frames_written = 0
+
+    def write(self, surface, timestamp=None):
+        """Writes the surface, which must be 32-bit with RGBA_MASKS, without
+        copying its pixels anywhere on the way."""
+        if timestamp is None:
+            timestamp = util.monotonic()
+        if self.header:
+            w, h = surface.get_size()
+            self.output.write(HEADER.pack('PPFR', w, h, surface.get_pitch(),
+                                          int(timestamp * 1000000)))
+        # the surface stays locked for as long as the buffer proxy lives.
+        pixels = surface.get_buffer()
+        try:
+            self.output.write(pixels)
+        finally:
+            del pixels
+        self.frames_written += 1
+
+    def close(self):
+        self.output.close()
@@ -1,5 +1,70 @@
 import collections
+import os
+import sys
+import time
+import timeit
+
+import pygame
 
 
 def recursive_default_dict():
     return collections.defaultdict(recursive_default_dict)
+
+
+def init_sdl():
+    # each entry point may be the first to need these, but there's no sense
+    # in going through SDL's init again when it's already been done.
+    if not pygame.display.get_init():
+        pygame.display.init()
+    if not pygame.joystick.get_init():
+        pygame.joystick.init()
+
+
+# from <time.h> on Linux.
+_CLOCK_MONOTONIC = 1
+
+
+def _linux_monotonic():
+    # CLOCK_MONOTONIC, read through ctypes; glibc before 2.17 only has
+    # clock_gettime in librt, and later ones have it in both.
+    import ctypes
+
+    class Timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    for library in ('librt.so.1', 'libc.so.6'):
+        try:
+            clock_gettime = ctypes.CDLL(library, use_errno=True).clock_gettime
+            break
+        except (OSError, AttributeError):
+            continue
+    else:
+        return None
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(Timespec)]
+
+    def monotonic():
+        now = Timespec()
+        if clock_gettime(_CLOCK_MONOTONIC, ctypes.byref(now)):
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        return now.tv_sec + now.tv_nsec * 1e-9
+
+    return monotonic
+
+
+def _monotonic():
+    # python 2 has no time.monotonic.  timeit's timer is time.clock on
+    # Windows, which counts the performance counter and so only moves
+    # forward, but elsewhere it's time.time, which jumps whenever the system
+    # clock is set.  on Linux the monotonic clock is read directly instead;
+    # anywhere else (or if that fails), time.time is all there is.
+    if hasattr(time, 'monotonic'):
+        return time.monotonic
+    if sys.platform.startswith('linux'):
+        return _linux_monotonic() or timeit.default_timer
+    return timeit.default_timer
+
+
+# seconds, from a clock that only ever moves forward, except on platforms
+# where _monotonic has to fall back to the time of day.
+monotonic = _monotonic()
@@ -1,45 +1,53 @@
+import errno
+import math
 import os
 import pygame
 
+import atlas
+import bundle
+import compositor
 import configurator
 import frame_buffer
+import latency
+import scheduler
+import startup
+import util
 
 
-class ButtonImage:
-    all = list()
+def _cropped(image, size):
+    # what's drawn of an image cropped to size: the surface to blit from,
+    # where the blit goes relative to the image's position, and its area.
+    if isinstance(image, atlas.Sprite):
+        return image.cropped(size)
+    return image, (0, 0), image.get_rect().clip(pygame.Rect((0, 0), size))
 
-    def __init__(self, screen, background, position, size, image_push=None,
-                 image_free=None, margin=0, auto_rect=True, copy_bg=False,
-                 copy_fg=False):
-        self.target = screen
+
+class ButtonImage:
+    def __init__(self, compositor, position, size, image_push=None,
+                 image_free=None, margin=0, auto_rect=True):
+        self.compositor = compositor
         self.image_push = image_push
         self.image_free = image_free
-        self.image = self.image_free or self.image_push
-        if self.image is None:
+        image = self.image_free or self.image_push
+        if image is None:
             raise ValueError
         self.position = tuple(position)
         self.size = pygame.Rect((0, 0), tuple(size))
         self.rect = self.size.copy()
         self.rect.center = self.position  # TODO: is centering this correct?
         if auto_rect:
-            self.rect = self.image.get_rect(center=self.position)
+            self.rect = image.get_rect(center=self.position)
         self.position = self.rect.topleft
-        self.domain_rect = self.rect.inflate(margin * 2, margin * 2).clip(
-            self.target.get_rect())
-        self.foreground = None
-        self.background = None
-        if background is not None:
-            if copy_fg:
-                self.foreground = background.subsurface(self.domain_rect).copy()
-            if copy_bg:
-                self.background = screen.subsurface(self.domain_rect).copy()
-            if self.image_push is None:
-                self.image_push = background.subsurface(self.rect).copy()
-            if self.image_free is None:
-                self.image_free = background.subsurface(self.rect).copy()
+        # everywhere this could ever draw, wherever it moves to.
+        self.bounds = self.rect.inflate(margin * 2, margin * 2).clip(
+            compositor.rect)
+        # with no image_free, a released button is just the background.
         self.image = self.image_free
-        ButtonImage.all.append(self)
-        self.dirty = True
+        self.pressed = False
+        self._crops = dict((id(image), _cropped(image, self.size.size))
+                           for image in (self.image_push, self.image_free)
+                           if image is not None)
+        compositor.add(self)
 
     def push(self, value):
         if value > 0.5:
@@ -48,23 +56,34 @@ class ButtonImage:
             self._release()
 
     def _press(self):
-        if self.image is not self.image_push:
-            self.image = self.image_push
-            self.dirty = True
+        self.pressed = True
+        self._show(self.image_push, self.position)
 
     def _release(self):
-        if self.image is not self.image_free:
-            self.image = self.image_free
-            self.dirty = True
+        self.pressed = False
+        self._show(self.image_free, self.position)
 
-    def draw(self, force=False):
-        if self.dirty or force:
-            if self.background:
-                self.target.blit(self.background, self.domain_rect)
-            self.target.blit(self.image, self.position, area=self.size)
-            if self.foreground:
-                self.target.blit(self.foreground, self.domain_rect)
-            self.dirty = False
+    def drawn_rect(self):
+        if self.image is None:
+            return pygame.Rect(self.position, (0, 0))
+        _, (x, y), area = self._crops[id(self.image)]
+        return pygame.Rect((self.position[0] + x, self.position[1] + y),
+                           area.size)
+
+    def _show(self, image, position):
+        # only what actually changes on screen is damaged: both where this
+        # was drawn and where it will be.
+        if image is not self.image or position != self.position:
+            self.compositor.damage(self.drawn_rect())
+            self.image = image
+            self.position = position
+            self.compositor.damage(self.drawn_rect())
+
+    def draw(self, target):
+        if self.image is not None:
+            surface, (x, y), area = self._crops[id(self.image)]
+            target.blit(surface, (self.position[0] + x, self.position[1] + y),
+                        area)
 
 
 class StickImage(ButtonImage):
@@ -74,11 +93,12 @@ class StickImage(ButtonImage):
             self.parent = parent
 
         def push(self, value):
+            value = min(1, max(0, value))
             if self.value != value:
-                self.value = min(1, max(0, value))
-                self.parent.dirty = True
+                self.value = value
+                self.parent.move()
 
-    def __init__(self, screen, background, position, size, radius, image_stick,
+    def __init__(self, compositor, position, size, radius, image_stick,
                  image_push=None):
         self.radius = int(radius)
         self.directions = {'up': StickImage.Direction(self),
@@ -86,77 +106,185 @@ class StickImage(ButtonImage):
                            'left': StickImage.Direction(self),
                            'right': StickImage.Direction(self),
                            'click': self}
-        ButtonImage.__init__(self, screen, background, position, size,
-                             image_push, image_stick, margin=self.radius,
-                             copy_bg=True)
+        # a stick that can't be clicked looks the same either way.
+        ButtonImage.__init__(self, compositor, position, size,
+                             image_push or image_stick, image_stick,
+                             margin=self.radius)
 
     def reset(self):
         for direction in self.directions.itervalues():
             direction.push(0)
 
-    def draw(self, force=False):
-        if self.dirty or force:
-            x = self.directions['right'].value - self.directions['left'].value
-            y = self.directions['down'].value - self.directions['up'].value
-            dist = ((x * x) + (y * y)) ** .5
-            if dist > 1.0:
-                x /= dist
-                y /= dist
-            self.position = self.rect.move(int(x * self.radius),
-                                           int(y * self.radius))
-            ButtonImage.draw(self)
+    def move(self):
+        x = self.directions['right'].value - self.directions['left'].value
+        y = self.directions['down'].value - self.directions['up'].value
+        dist = ((x * x) + (y * y)) ** .5
+        if dist > 1.0:
+            x /= dist
+            y /= dist
+        # most small changes in an axis don't move the stick a whole pixel.
+        self._show(self.image, (self.rect.left + int(x * self.radius),
+                                self.rect.top + int(y * self.radius)))
 
 
 class TriggerImage(ButtonImage):
-    def __init__(self, screen, background, position, size, depth,
-                 image_trigger):
+    def __init__(self, compositor, position, size, depth, image_trigger):
         self.depth = int(depth)
         self.value = 0.0
-        self.redraws = set()
-        ButtonImage.__init__(self, screen, background, position, size,
+        ButtonImage.__init__(self, compositor, position, size,
                              image_trigger, image_trigger, margin=self.depth,
-                             auto_rect=False, copy_bg=True, copy_fg=True)
+                             auto_rect=False)
 
     def push(self, value):
-        if self.value != value:
-            self.value = min(1, max(0, value))
-            self.dirty = True
-
-    def update_redraws(self):
-        self.redraws = set(
-            ButtonImage.all[bi] for bi in self.domain_rect.collidelistall(
-                [b.domain_rect for b in ButtonImage.all]
-            ) if ButtonImage.all[bi] is not self
-        )
-
-    def draw(self, force=False):
-        if self.dirty or force:
-            self.position = self.rect.move(0, int(self.value * self.depth))
-            ButtonImage.draw(self)
-            for b in self.redraws:
-                b.draw(force=True)
+        self.value = min(1, max(0, value))
+        self._show(self.image, (self.rect.left,
+                                self.rect.top + int(self.value * self.depth)))
+
+
+class BackgroundLayer:
+    """The skin's background, or a part of it, drawn over the pad's
+    background color."""
+
+    def __init__(self, image, origin, bounds, color=None):
+        self.image = image
+        self.origin = origin
+        self.bounds = bounds
+        self.color = color
+        self._area = bounds.move(-origin[0], -origin[1])
+
+    def draw(self, target):
+        if self.color is not None:
+            target.fill(self.color, self.bounds)
+        target.blit(self.image, self.bounds, area=self._area)
+
+
+class SkinImages:
+    """A skin's images, each decoded once, along with the background and an
+    atlas of the rest, at whatever size they were last asked for."""
+
+    def __init__(self, path, scale_function=pygame.transform.scale,
+                 preloaded=None):
+        self.path = path
+        self.scale_function = scale_function
+        self._images = dict(preloaded or dict())
+        self._backgrounds = dict()
+        self._atlases = dict()
+
+    def load(self, name):
+        image = self._images.get(name)
+        if image is None:
+            image = pygame.image.load(os.path.join(self.path, '%s.png' % name))
+            self._images[name] = image
+        return image
+
+    def background(self, name, size=None):
+        """An image for drawing as it is, in the display's format."""
+        cached_size, image = self._backgrounds.get(name, (None, None))
+        if image is None or cached_size != size:
+            if size is None:
+                image = self.load(name)
+            else:
+                image = self.scale_function(self.load(name), size)
+            image = atlas.display_format(image)
+            self._backgrounds[name] = (size, image)
+        return image
+
+    def sprites(self, names, size_of=None):
+        """The named images packed into one atlas, as a dict of name to
+        atlas.Sprite, each scaled to size_of(name) if that's given.  The
+        last atlas made of the same names is kept for reuse."""
+        names = tuple(names)
+        sizes = None
+        if size_of is not None:
+            sizes = tuple(tuple(size_of(name)) for name in names)
+        cached_sizes, sprites = self._atlases.get(names, (None, None))
+        if sprites is None or cached_sizes != sizes:
+            if sizes is None:
+                images = dict((name, self.load(name)) for name in names)
+            else:
+                images = dict((name, self.scale_function(self.load(name),
+                                                         size))
+                              for name, size in zip(names, sizes))
+            sprites = atlas.pack(images)
+            self._atlases[names] = (sizes, sprites)
+        return sprites
 
 
 class PadImage:
-    def __init__(self, cfg, screen):
+    def __init__(self, cfg, screen, images=None, scale=None, origin=(0, 0)):
         assert isinstance(cfg, configurator.PadConfig)
         self.buttons = dict()
         self.triggers = dict()
         self.sticks = dict()
 
-        def load_image(name):
-            return pygame.image.load(os.path.join(cfg.path, '%s.png' % name))
+        # several pads may share one SkinImages (and one target), but each
+        # keeps its own elements and so its own state.
+        if images is None:
+            images = SkinImages(cfg.path)
+        self.cfg = cfg
+        self.images = images
+        self.origin = tuple(origin)
+
+        # with a scale, everything is laid out and drawn at (x, y) times the
+        # skin's resolution, using the rescaled images cached by SkinImages.
+        if scale is None:
+            def fit(pair):
+                return tuple(pair)
+
+            size_of = None
+            background_size = None
+        else:
+            def fit(pair):
+                return (int(round(pair[0] * scale[0])),
+                        int(round(pair[1] * scale[1])))
+
+            def size_of(name):
+                return fit(images.load(name).get_size())
+
+            background_size = size_of(cfg.background)
+
+        def place(position):
+            return fit((position[0] + origin[0], position[1] + origin[1]))
+
+        # every element is drawn from a single atlas, of only the pixels
+        # that can be seen, already in the display's format.
+        sprites = images.sprites([name for name in cfg.image_names()
+                                  if name != cfg.background], size_of)
+        load_image = sprites.__getitem__
 
         self.target = screen
-        self.target.fill(cfg.background_color)
-        self.background = load_image(cfg.background)
-        self.target.blit(self.background, (0, 0))
+        self.background = images.background(cfg.background, background_size)
+        background_origin = place((0, 0))
+        pad_rect = pygame.Rect(background_origin, fit(cfg.size)).clip(
+            screen.get_rect())
+        self.compositor = compositor.Compositor(screen, pad_rect)
+
+        # triggers slide under the shell, so they go between the background
+        # and the part of it that covers them; buttons and sticks go on top.
+        self.compositor.add(BackgroundLayer(
+            self.background, background_origin, pad_rect,
+            cfg.background_color))
+
+        for trigger_cfg in cfg.triggers.itervalues():
+            assert isinstance(trigger_cfg, configurator.TriggerConfig)
+            image_trigger = load_image(trigger_cfg.name)
+            depth = trigger_cfg.depth
+            if scale is not None:
+                depth = int(round(depth * scale[1]))
+            obj = TriggerImage(self.compositor, place(trigger_cfg.position),
+                               fit(trigger_cfg.size), depth, image_trigger)
+            self.triggers[trigger_cfg.name] = obj
+
+        for trigger in self.triggers.itervalues():
+            self.compositor.add(BackgroundLayer(
+                self.background, background_origin,
+                trigger.bounds.clip(pad_rect)))
 
         for button_cfg in cfg.buttons.itervalues():
             assert isinstance(button_cfg, configurator.ButtonConfig)
             image_push = load_image(button_cfg.name)
-            obj = ButtonImage(self.target, self.background,
-                              button_cfg.position, button_cfg.size, image_push)
+            obj = ButtonImage(self.compositor, place(button_cfg.position),
+                              fit(button_cfg.size), image_push)
             self.buttons[button_cfg.name] = obj
 
         for stick_cfg in cfg.sticks.itervalues():
@@ -165,32 +293,36 @@ class PadImage:
             image_click = None
             if stick_cfg.clickable:
                 image_click = load_image(stick_cfg.name + '-click')
-            obj = StickImage(self.target, self.background,
-                             stick_cfg.position, stick_cfg.size,
-                             stick_cfg.radius, image_stick, image_click)
+            radius = stick_cfg.radius
+            if scale is not None:
+                radius = int(round(radius * min(scale)))
+            obj = StickImage(self.compositor, place(stick_cfg.position),
+                             fit(stick_cfg.size), radius, image_stick,
+                             image_click)
             self.sticks[stick_cfg.name] = obj
 
-        for trigger_cfg in cfg.triggers.itervalues():
-            assert isinstance(trigger_cfg, configurator.TriggerConfig)
-            image_trigger = load_image(trigger_cfg.name)
-            obj = TriggerImage(self.target, self.background,
-                               trigger_cfg.position, trigger_cfg.size,
-                               trigger_cfg.depth, image_trigger)
-            self.triggers[trigger_cfg.name] = obj
-
-        for trigger in self.triggers.itervalues():
-            trigger.update_redraws()
+        self.compositor.damage_all()
+
+    def elements(self):
+        return (self.buttons.values() + self.sticks.values() +
+                self.triggers.values())
+
+    def rescaled(self, screen, scale):
+        """Builds this pad again at a new scale, in the same state."""
+        result = PadImage(self.cfg, screen, self.images, scale, self.origin)
+        for name, button in result.buttons.iteritems():
+            button.push(self.buttons[name].pressed)
+        for name, stick in result.sticks.iteritems():
+            old_stick = self.sticks[name]
+            for which in ('up', 'down', 'left', 'right'):
+                stick.directions[which].push(old_stick.directions[which].value)
+            stick.push(old_stick.pressed)
+        for name, trigger in result.triggers.iteritems():
+            trigger.push(self.triggers[name].value)
+        return result
 
     def draw(self):
-        for button in self.buttons.itervalues():
-            assert isinstance(button, ButtonImage)
-            button.draw()
-        for stick in self.sticks.itervalues():
-            assert isinstance(stick, StickImage)
-            stick.draw()
-        for trigger in self.triggers.itervalues():
-            assert isinstance(trigger, TriggerImage)
-            trigger.draw()
+        self.compositor.composite()
 
 
 def _get_target(pad_gfx, map_element):
@@ -208,67 +340,576 @@ def _get_target(pad_gfx, map_element):
     return target
 
 
-def main(skin, joy_index):
-    pygame.display.init()
-    pygame.joystick.init()
-
-    joy = pygame.joystick.Joystick(joy_index)
-    joy.init()
-    mappings = configurator.load_mappings(skin)
-    if joy.get_name() not in mappings:
-        print 'Please run the mapper on', joy.get_name(), 'with', skin, 'skin.'
+def _index_table(section, compile_entry, with_index=False):
+    # turns a {'<index>': entry} mapping section into a list indexed by int,
+    # with an empty tuple for every index that isn't mapped.
+    table = list()
+    for key, entry in section.iteritems():
+        index = int(key)
+        if index >= len(table):
+            table.extend(tuple() for _ in xrange(index + 1 - len(table)))
+        if with_index:
+            table[index] = compile_entry(key, entry)
+        else:
+            table[index] = compile_entry(entry)
+    return table
+
+
+class InputDispatcher:
+    """A joystick mapping compiled down to bound push methods, indexed by
+    button/axis/hat number, so dispatching an event is a couple of list
+    lookups instead of walking the JSON-shaped mapping."""
+
+    _hat_coefficients = {'up': (0, 1), 'down': (0, -1),
+                         'left': (-1, 0), 'right': (1, 0)}
+
+    def __init__(self, mapping, pad_gfx):
+        def compile_button(elt):
+            return _get_target(pad_gfx, elt).push
+
+        calibration = mapping.get('calibration', dict())
+
+        def compile_axis(index, changes):
+            # the mapper records how far (and which way) an axis moved from
+            # rest: +-1 for half of a centered axis, +-2 for a full sweep of
+            # an axis resting at one end, such as most analog triggers.  with
+            # the axis's measured rest and range, that's an affine transform
+            # from where it rests (0) to how far it actually goes (1).
+            limits = calibration.get(index, dict())
+            result = list()
+            for change, elt in changes.iteritems():
+                change = int(change)
+                sign = change // abs(change)
+                rest = limits.get('rest', 0.0 if abs(change) == 1 else -sign)
+                end = limits.get('max' if sign > 0 else 'min', sign)
+                if (end - rest) * sign <= 0:
+                    # a range that makes no sense; assume an ideal axis.
+                    rest, end = (0.0 if abs(change) == 1 else -sign), sign
+                scale = 1.0 / (end - rest)
+                result.append((_get_target(pad_gfx, elt).push, scale,
+                               -rest * scale))
+            return tuple(result)
+
+        def compile_hat(directions):
+            return tuple((_get_target(pad_gfx, elt).push,)
+                         + InputDispatcher._hat_coefficients[direction]
+                         for direction, elt in directions.iteritems())
+
+        self.buttons = _index_table(mapping.get('button', dict()),
+                                    compile_button)
+        self.axes = _index_table(mapping.get('axis', dict()), compile_axis,
+                                 with_index=True)
+        self.hats = _index_table(mapping.get('hat', dict()), compile_hat)
+
+    def button(self, index, value):
+        if index < len(self.buttons) and self.buttons[index]:
+            self.buttons[index](value)
+
+    def axis(self, index, value):
+        if index < len(self.axes):
+            for push, scale, offset in self.axes[index]:
+                push(max(0, value * scale + offset))
+
+    def hat(self, index, value):
+        if index < len(self.hats):
+            x, y = value
+            for push, x_coefficient, y_coefficient in self.hats[index]:
+                push(x * x_coefficient + y * y_coefficient)
+
+    def dispatch(self, event):
+        kind = event.type
+        if kind == pygame.JOYAXISMOTION:
+            self.axis(event.axis, event.value)
+        elif kind == pygame.JOYBUTTONDOWN:
+            self.button(event.button, 1)
+        elif kind == pygame.JOYBUTTONUP:
+            self.button(event.button, 0)
+        elif kind == pygame.JOYHATMOTION:
+            self.hat(event.hat, event.value)
+
+
+class InputSnapshot:
+    """One joystick's events since the last frame, reduced to the latest
+    value of each axis, hat and button, so that applying them costs one
+    push per control however many events there were.
+
+    A button or hat that's pressed and released again between two frames
+    would otherwise never be seen, so it's shown pressed for this frame and
+    released on the next one."""
+
+    def __init__(self):
+        self.buttons = dict()
+        self.axes = dict()
+        self.hats = dict()
+        self._taps = set()
+        self._hat_taps = set()
+        self._releases = set()
+        self._hat_releases = set()
+
+    @property
+    def releases_pending(self):
+        return bool(self._releases or self._hat_releases)
+
+    def add(self, event):
+        kind = event.type
+        if kind == pygame.JOYAXISMOTION:
+            self.axes[event.axis] = event.value
+        elif kind == pygame.JOYBUTTONDOWN:
+            self.buttons[event.button] = 1
+            self._taps.discard(event.button)
+        elif kind == pygame.JOYBUTTONUP:
+            if self.buttons.get(event.button) == 1:
+                self._taps.add(event.button)
+            else:
+                self.buttons[event.button] = 0
+        elif kind == pygame.JOYHATMOTION:
+            value = tuple(event.value)
+            if value == (0, 0) and self.hats.get(event.hat, (0, 0)) != value:
+                self._hat_taps.add(event.hat)
+            else:
+                self.hats[event.hat] = value
+                self._hat_taps.discard(event.hat)
+
+    def apply(self, dispatcher):
+        for button in self._releases:
+            if button not in self.buttons:
+                dispatcher.button(button, 0)
+        for hat in self._hat_releases:
+            if hat not in self.hats:
+                dispatcher.hat(hat, (0, 0))
+        for button, value in self.buttons.iteritems():
+            dispatcher.button(button, value)
+        for axis, value in self.axes.iteritems():
+            dispatcher.axis(axis, value)
+        for hat, value in self.hats.iteritems():
+            dispatcher.hat(hat, value)
+        self._releases, self._taps = self._taps, set()
+        self._hat_releases, self._hat_taps = self._hat_taps, set()
+        self.buttons.clear()
+        self.axes.clear()
+        self.hats.clear()
+
+
+class InputRouter:
+    """Takes joystick events off the queue into a snapshot per joystick,
+    and applies each snapshot to that joystick's pad once per frame."""
+
+    def __init__(self, mappings, joy_indices, pads):
+        self._joy_indices = joy_indices
+        self._snapshots = dict((joy, InputSnapshot()) for joy in joy_indices)
+        self.set_pads(mappings, pads)
+
+    def set_pads(self, mappings, pads):
+        self._dispatchers = dict(
+            (joy, InputDispatcher(mapping, pad))
+            for joy, mapping, pad in zip(self._joy_indices, mappings, pads))
+
+    @property
+    def releases_pending(self):
+        return any(snapshot.releases_pending
+                   for snapshot in self._snapshots.itervalues())
+
+    def add(self, event):
+        if len(self._snapshots) == 1:
+            # a lone pad takes input from any joystick, as it always has.
+            self._snapshots[self._joy_indices[0]].add(event)
+        else:
+            snapshot = self._snapshots.get(getattr(event, 'joy', None))
+            if snapshot is not None:
+                snapshot.add(event)
+
+    def apply(self):
+        for joy, snapshot in self._snapshots.iteritems():
+            snapshot.apply(self._dispatchers[joy])
+
+
+_IDLE_HEARTBEAT = pygame.USEREVENT
+_REPLAY_STEP = 1.0 / 60
+_LATENCY_KEY = pygame.K_F3
+_HUD_KEY = pygame.K_F4
+_CAPTION_INTERVAL = 0.5
+_NETWORK_IDLE_POLL = 0.05
+# the input history's width, as a fraction of the pad's height.
+_HISTORY_WIDTH = 3
+_HISTORY_HEIGHT = 8
+
+
+def _show_frame_counts(fb):
+    presented, wall_clock = fb.frame_counts()
+    pygame.display.set_caption('{} of {} frames presented'.format(
+        presented, wall_clock))
+
+
+def _headless_frame_buffer(size, background_color):
+    import stream
+    # the dummy driver's display is 8-bit unless asked otherwise, and images
+    # are converted to the display's format, so ask for 32 bits lest they
+    # be squeezed into its palette on the way to the RGBA frame.
+    return frame_buffer.FrameBuffer(
+        size, size, flags=0, background_color=background_color,
+        masks=stream.RGBA_MASKS, depth=32)
+
+
+def _warn_filter_skipped(scale_filter):
+    import filters
+    print 'The %s filter scales by %d, more than fits the window; ' \
+          'scaling the usual way until it\'s larger.' % (
+              scale_filter, filters.FILTERS[scale_filter].factor)
+
+
+def main(skin, joy_index, idle=False, native=False, headless=False,
+         output='-', changed_only=False, frame_header=True, record=None,
+         replay=None, replay_speed=1.0, columns=None, latency_log=None,
+         schedule='deadline', listen=None, tcp=False, serve=None,
+         scale_filter=None, history=False, stats=None, heatmap=False,
+         profile=None):
+    if headless:
+        os.environ['SDL_VIDEODRIVER'] = 'dummy'
+        native = False
+    if scale_filter is not None and not native and not headless:
+        import filters
+        if scale_filter not in filters.FILTERS:
+            print 'No such filter as %s; try one of %s.' % (
+                scale_filter, ', '.join(filters.FILTERS))
+            return
+        if not filters.available():
+            print 'Filters need NumPy; scaling the usual way instead.'
+            scale_filter = None
+    else:
+        scale_filter = None
+    if stats is not None or heatmap:
+        import stats as stats_module
+        if not stats_module.available():
+            print 'Statistics and heatmaps need NumPy; leaving them out.'
+            stats = None
+            heatmap = False
+    util.init_sdl()
+    startup.profile.mark('SDL init')
+
+    # given several joysticks, each gets its own pad, tiled in one window.
+    joy_indices = joy_index
+    if not isinstance(joy_indices, (list, tuple)):
+        joy_indices = [joy_index]
+    if len(joy_indices) > 1 and (record is not None or replay is not None or
+                                 listen is not None):
+        print 'Recording, replaying and listening only work with a single ' \
+              'joystick.'
         return
 
-    mappings = mappings[joy.get_name()]
-
-    button_map = mappings.get('button', dict())
-    axis_map = mappings.get('axis', dict())
-    hat_map = mappings.get('hat', dict())
-
-    pad_cfg = configurator.PadConfig(skin)
-
-    fb = frame_buffer.FrameBuffer(pad_cfg.size, pad_cfg.size,
-                                  scale_smooth=pad_cfg.anti_aliasing,
-                                  background_color=pad_cfg.background_color)
-    pad_gfx = PadImage(pad_cfg, fb)
-
-    while not pygame.event.peek(pygame.QUIT):
-        for event in pygame.event.get():
-            if event.type == pygame.JOYBUTTONDOWN:
-                if str(event.button) in button_map:
-                    elt = button_map[str(event.button)]
-                    _get_target(pad_gfx, elt).push(1)
-            elif event.type == pygame.JOYBUTTONUP:
-                if str(event.button) in button_map:
-                    elt = button_map[str(event.button)]
-                    _get_target(pad_gfx, elt).push(0)
-            elif event.type == pygame.JOYAXISMOTION:
-                if str(event.axis) in axis_map:
-                    for change, elt in axis_map[str(event.axis)].iteritems():
-                        change = int(change)
-                        value = event.value
-                        if abs(change) == 2:
-                            value += change / abs(change)
-                        value /= change
-                        value = max(0, value)
-                        _get_target(pad_gfx, elt).push(value)
-            elif event.type == pygame.JOYHATMOTION:
-                if str(event.hat) in hat_map:
-                    direction_map = hat_map[str(event.hat)]
-                    x, y = event.value
-                    if 'up' in direction_map:
-                        _get_target(pad_gfx, direction_map['up']).push(y)
-                    if 'down' in direction_map:
-                        _get_target(pad_gfx, direction_map['down']).push(-y)
-                    if 'left' in direction_map:
-                        _get_target(pad_gfx, direction_map['left']).push(-x)
-                    if 'right' in direction_map:
-                        _get_target(pad_gfx, direction_map['right']).push(x)
-            fb.handle_event(event)
-
-        pad_gfx.draw()
-        fb.flip()
-        fb.limit_fps(set_caption=True)
+    # a replay stands in for the joystick, events and all; its speed is a
+    # multiple of real time, or 0 to feed one frame's worth of the recording
+    # per frame with no frame rate limit.
+    replay_source = None
+    receiver = None
+    # the modules behind optional features are only imported when they're
+    # used, so as not to slow down every other startup.
+    if replay is not None:
+        import recording
+        replay_source = recording.Replay(replay)
+        joy_names = [replay_source.joy_name]
+        joy_guids = [None]
+        idle = False
+    elif listen is not None:
+        # so is a sender on another machine, once it's said which joystick
+        # it's reading.
+        import netinput
+        receiver = netinput.Receiver(netinput.parse_address(listen), tcp)
+        print 'waiting for input on port', receiver.address[1]
+        joy_names = [receiver.wait_for_name()]
+        joy_guids = [None]
+    else:
+        joy_names = list()
+        joy_guids = list()
+        for index in joy_indices:
+            joy = pygame.joystick.Joystick(index)
+            joy.init()
+            joy_names.append(joy.get_name())
+            joy_guids.append(configurator.joystick_guid(joy))
+    mappings = list()
+    for joy_name, joy_guid in zip(joy_names, joy_guids):
+        mapping = configurator.mapping_store.get(skin, joy_name, joy_guid)
+        if mapping is None:
+            print 'Please run the mapper on', joy_name, 'with', skin, 'skin.'
+            return
+        mappings.append(mapping)
+    startup.profile.mark('mappings')
+
+    pad_cfg, preloaded = bundle.open_skin(skin)
+    if columns is None:
+        columns = int(math.ceil(math.sqrt(len(joy_names))))
+    rows = (len(joy_names) + columns - 1) // columns
+    w, h = pad_cfg.size
+    # an input history goes to the right of each pad.
+    history_width = h * _HISTORY_WIDTH // _HISTORY_HEIGHT if history else 0
+    fb_size = ((w + history_width) * columns, h * rows)
+    origins = [((i % columns) * (w + history_width), (i // columns) * h)
+               for i in xrange(len(joy_names))]
+
+    writer = None
+    if headless:
+        import stream
+        # draw into an offscreen RGBA frame buffer and stream that out,
+        # rather than presenting anything.
+        writer = stream.FrameWriter(stream.open_output(output), frame_header)
+        fb = _headless_frame_buffer(fb_size, pad_cfg.background_color)
+    else:
+        fb = frame_buffer.FrameBuffer(
+            fb_size, fb_size, scale_smooth=pad_cfg.anti_aliasing,
+            background_color=pad_cfg.background_color, native=native,
+            scale_type='filter' if scale_filter else 'pixelperfect',
+            scale_filter=scale_filter)
+    filter_skipped = False
+    if scale_filter is not None and fb.filter_skipped:
+        _warn_filter_skipped(scale_filter)
+        filter_skipped = True
+    if native:
+        images = SkinImages(pad_cfg.path, fb.scale_image, preloaded)
+        target = fb.native_target()
+        pads = [PadImage(pad_cfg, target, images, fb.scale_factors(), origin)
+                for origin in origins]
+    else:
+        images = SkinImages(pad_cfg.path, preloaded=preloaded)
+        pads = [PadImage(pad_cfg, fb, images, origin=origin)
+                for origin in origins]
+    router = InputRouter(mappings, joy_indices, pads)
+
+    histories = list()
+    strips = list()
+    if history:
+        import history as history_module
+        histories = [history_module.InputHistory(pad) for pad in pads]
+
+        def make_strips(target, scale=(1.0, 1.0)):
+            return [history_module.HistoryStrip(
+                input_history, target, pygame.Rect(
+                    int((origin[0] + w) * scale[0]),
+                    int(origin[1] * scale[1]),
+                    int(history_width * scale[0]), int(h * scale[1])),
+                pad_cfg.background_color)
+                for input_history, origin in zip(histories, origins)]
+
+        if native:
+            strips = make_strips(target, fb.scale_factors())
+        else:
+            strips = make_strips(fb)
+
+    session_stats = None
+    if stats is not None or heatmap:
+        session_stats = stats_module.SessionStats(pads, overlay=heatmap)
+    startup.profile.mark('pad setup')
+
+    # the frame profiler is attached with --profile, or the first time the
+    # HUD is asked for; until then, nothing in the loop is timed.
+    frame_profiler = None
+    hud = None
+
+    def attach_profiler(new_profiler):
+        fb.profiler = new_profiler
+        compositor.Compositor.profiler = new_profiler
+        return new_profiler
+
+    if profile is not None:
+        import profiler
+        frame_profiler = attach_profiler(profiler.FrameProfiler(profile))
+
+    broadcaster = None
+    if serve is not None:
+        import broadcast
+        import netinput
+        # only this machine can see the overlay unless a host to listen on
+        # is given, such as 0.0.0.0 for every interface.
+        broadcaster = broadcast.Broadcaster(
+            netinput.parse_address(serve, '127.0.0.1'), pad_cfg, pads,
+            columns)
+        print 'serving the overlay at http://%s:%d/' % broadcaster.address
+
+    recorder = None
+    if record is not None:
+        import recording
+        recorder = recording.Recorder(record, joy_names[0])
+
+    # input latency is tracked all session, so that F3 can swap the caption
+    # over to its percentiles; a latency log only adds saving it on exit.
+    tracker = latency.LatencyTracker()
+    show_latency = False
+    last_caption_time = 0
+
+    # 'adaptive' is FrameBuffer.limit_fps's own pacing.  idle mode and fast
+    # replays aren't paced against deadlines at all.
+    fast_replay = replay_source is not None and not replay_speed
+    frame_scheduler = None
+    if schedule != 'adaptive' and not idle and not fast_replay:
+        frame_scheduler = scheduler.FrameScheduler(policy=schedule)
+
+    if idle:
+        # wake up once a second even without input, to refresh the caption.
+        pygame.time.set_timer(_IDLE_HEARTBEAT, 1000)
+
+    running = True
+    first_frame = True
+    last_time = util.monotonic()
+    while running:
+        if frame_profiler is not None:
+            frame_profiler.begin_frame()
+        if idle and receiver is not None:
+            # pygame can't wake up for packets, so wait on the socket and
+            # look at the event queue every so often.
+            if not router.releases_pending:
+                receiver.wait(_NETWORK_IDLE_POLL)
+            events = pygame.event.get()
+        elif idle and not router.releases_pending:
+            events = [pygame.event.wait()]
+            events.extend(pygame.event.get())
+        elif idle:
+            events = pygame.event.get()
+        elif frame_scheduler is not None:
+            events = frame_scheduler.wait()
+        else:
+            events = pygame.event.get()
+        if replay_source is not None:
+            if replay_speed:
+                now = util.monotonic()
+                events.extend(replay_source.advance(
+                    (now - last_time) * replay_speed))
+                last_time = now
+            else:
+                events.extend(replay_source.advance(_REPLAY_STEP))
+            running = not replay_source.finished
+        elif receiver is not None:
+            events.extend(receiver.poll())
+        if frame_profiler is not None:
+            frame_profiler.lap('wait')
+        tracker.arrived(events, util.monotonic())
+        for event in events:
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == _IDLE_HEARTBEAT:
+                if show_latency:
+                    pygame.display.set_caption(tracker.caption())
+                else:
+                    _show_frame_counts(fb)
+            elif event.type == pygame.KEYDOWN and event.key == _LATENCY_KEY:
+                show_latency = not show_latency
+            elif event.type == pygame.KEYDOWN and event.key == _HUD_KEY:
+                if hud is None:
+                    import profiler
+                    if frame_profiler is None:
+                        frame_profiler = attach_profiler(
+                            profiler.FrameProfiler())
+                    hud = profiler.HudLayer(pads[0].compositor)
+                hud.show(not hud.visible)
+            else:
+                if recorder is not None:
+                    recorder.record(event)
+                router.add(event)
+            resized = fb.handle_event(event)
+            if resized and scale_filter is not None and \
+                    fb.filter_skipped != filter_skipped:
+                filter_skipped = fb.filter_skipped
+                if filter_skipped:
+                    _warn_filter_skipped(scale_filter)
+            if resized and native:
+                router.apply()
+                target = fb.native_target()
+                pads = [pad.rescaled(target, fb.scale_factors())
+                        for pad in pads]
+                router.set_pads(mappings, pads)
+                if history:
+                    for input_history, pad in zip(histories, pads):
+                        input_history.bind(pad)
+                    strips = make_strips(target, fb.scale_factors())
+                if session_stats is not None:
+                    session_stats.bind(pads)
+                if hud is not None:
+                    visible = hud.visible
+                    hud = profiler.HudLayer(pads[0].compositor)
+                    hud.show(visible)
+        router.apply()
+        if session_stats is not None:
+            session_stats.sample(util.monotonic())
+        if history:
+            now = util.monotonic()
+            for input_history in histories:
+                input_history.sample(now)
+            for strip in strips:
+                strip.update(now)
+                strip.draw()
+        if broadcaster is not None:
+            broadcaster.publish(pads)
+
+        tracker.reached('dispatch', util.monotonic())
+        if frame_profiler is not None:
+            if hud is not None:
+                hud.refresh(frame_profiler, util.monotonic())
+            frame_profiler.lap('events')
+        for pad in pads:
+            pad.draw()
+        damaged = fb.dirty
+        if frame_profiler is not None:
+            frame_profiler.lap('draw')
+        tracker.reached('draw', util.monotonic())
+        if writer is not None:
+            if fb.dirty or not changed_only:
+                try:
+                    writer.write(fb)
+                except IOError as e:
+                    if e.errno != errno.EPIPE:
+                        raise
+                    running = False
+                fb.mark_presented()
+            if frame_profiler is not None:
+                frame_profiler.lap('present')
+            if frame_scheduler is None and not fast_replay:
+                fb.tick()
+        elif idle:
+            if damaged:
+                fb.update(delay=False)
+                fb.tick()
+        elif frame_scheduler is None and not fast_replay:
+            fb.update()
+            fb.limit_fps(set_caption=not show_latency)
+        else:
+            fb.update(delay=False)
+
+        now = util.monotonic()
+        if first_frame:
+            startup.profile.mark('first frame')
+            startup.profile.report()
+            first_frame = False
+        if frame_scheduler is not None:
+            frame_scheduler.frame_done(damaged)
+        tracker.presented(damaged, now)
+        if (show_latency or frame_scheduler is not None) and not idle and \
+                now - last_caption_time > _CAPTION_INTERVAL:
+            if show_latency:
+                pygame.display.set_caption(tracker.caption())
+            else:
+                pygame.display.set_caption(frame_scheduler.caption())
+            last_caption_time = now
+        if frame_profiler is not None:
+            # whatever's left is frame rate limiting and bookkeeping.
+            frame_profiler.lap('limit')
+            frame_profiler.end_frame()
+
+    if idle:
+        pygame.time.set_timer(_IDLE_HEARTBEAT, 0)
+    if writer is not None:
+        writer.close()
+    if recorder is not None:
+        recorder.close()
+    if receiver is not None:
+        receiver.close()
+    if broadcaster is not None:
+        broadcaster.close()
+    if latency_log is not None:
+        tracker.save(latency_log)
+    if stats is not None:
+        session_stats.save(stats)
+    if frame_profiler is not None:
+        frame_profiler.close()
+        attach_profiler(None)
+    presented, wall_clock = fb.frame_counts()
+    print 'presented', presented, 'of', wall_clock, 'frames'
 
 
 if __name__ == '__main__':
@@ -0,0 +1,43 @@
+"""What the render benchmark counts as a regression against a baseline."""
+
+import os
+import unittest
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+from padpyght import benchmark
+
+
+def run(*cases):
+    return {'results': [{'skin': 'snes', 'scale': 'pixelperfect',
+                         'pattern': pattern, 'median_ms': median_ms}
+                        for pattern, median_ms in cases]}
+
+
+class FindRegressionsTest(unittest.TestCase):
+    def regressions(self, baseline, results):
+        return [result['pattern'] for result, old in
+                benchmark.find_regressions(run(*results), run(*baseline),
+                                           0.25, 0.1)]
+
+    def test_slower_beyond_tolerance(self):
+        self.assertEqual(self.regressions([('all', 4.0)], [('all', 6.0)]),
+                         ['all'])
+
+    def test_within_tolerance(self):
+        self.assertEqual(self.regressions([('all', 4.0)], [('all', 4.8)]), [])
+
+    def test_faster(self):
+        self.assertEqual(self.regressions([('all', 4.0)], [('all', 2.0)]), [])
+
+    def test_tiny_frames_are_noise(self):
+        self.assertEqual(self.regressions([('idle', 0.004)],
+                                          [('idle', 0.009)]), [])
+
+    def test_cases_missing_from_the_baseline(self):
+        self.assertEqual(self.regressions([('all', 4.0)], [('mash', 9.0)]),
+                         [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+"""Presenting only what changed leaves the window as a full flip would."""
+
+import os
+import random
+import unittest
+
+os.environ['SDL_VIDEODRIVER'] = 'dummy'
+
+import pygame
+
+from padpyght import frame_buffer
+
+COLORS = [(255, 0, 0), (0, 255, 0), (250, 250, 250), (0, 0, 0)]
+
+
+class PartialUpdateTest(unittest.TestCase):
+    def setUp(self):
+        pygame.display.init()
+        frame_buffer.FrameBuffer.instance = None
+
+    def tearDown(self):
+        pygame.display.quit()
+
+    def scatter(self, fb, count):
+        for _ in xrange(count):
+            blob = pygame.Surface((self.random.randint(1, 7),
+                                   self.random.randint(1, 7)))
+            blob.fill(self.random.choice(COLORS))
+            fb.blit(blob, (self.random.randint(-3, fb.get_width()),
+                           self.random.randint(-3, fb.get_height())))
+
+    def check_scale2x(self, scale):
+        self.random = random.Random(scale)
+        fb = frame_buffer.FrameBuffer((64 * scale, 48 * scale), (64, 48),
+                                      scale_type='scale2x', depth=32)
+        self.scatter(fb, 60)
+        fb.flip(delay=False)
+        for _ in xrange(10):
+            self.scatter(fb, 6)
+            fb.update(delay=False)
+        partial = pygame.surfarray.array3d(pygame.display.get_surface())
+        fb.flip(delay=False)
+        full = pygame.surfarray.array3d(pygame.display.get_surface())
+        self.assertEqual((partial != full).sum(), 0)
+
+    def test_scale2x_once(self):
+        self.check_scale2x(2)
+
+    def test_scale2x_twice(self):
+        self.check_scale2x(4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+"""Colours drawn headless reach the RGBA frame as they are."""
+
+import os
+import unittest
+
+os.environ['SDL_VIDEODRIVER'] = 'dummy'
+
+import pygame
+
+from padpyght import atlas
+from padpyght import frame_buffer
+from padpyght import history
+from padpyght import visualizer
+
+COLOR = (200, 120, 40)
+
+
+class FakePad:
+    buttons = dict()
+    triggers = dict()
+    sticks = dict()
+
+
+class HeadlessColorTest(unittest.TestCase):
+    def setUp(self):
+        pygame.display.init()
+        frame_buffer.FrameBuffer.instance = None
+        self.fb = visualizer._headless_frame_buffer((64, 32), COLOR)
+
+    def tearDown(self):
+        pygame.display.quit()
+
+    def test_background_survives(self):
+        background = pygame.Surface((16, 16))
+        background.fill(COLOR)
+        self.fb.blit(atlas.display_format(background), (0, 0))
+        self.assertEqual(tuple(self.fb.get_at((8, 8)))[:3], COLOR)
+
+    def test_history_strip_survives(self):
+        strip = history.HistoryStrip(history.InputHistory(FakePad()),
+                                     self.fb, (32, 0, 32, 32), color=COLOR)
+        strip.draw()
+        self.assertEqual(tuple(self.fb.get_at((48, 16)))[:3], COLOR)
+
+
+if __name__ == '__main__':
+    unittest.main()
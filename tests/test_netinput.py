@@ -0,0 +1,225 @@
+"""Sender to receiver over loopback, with packets dropped, duplicated and
+delivered out of order on the way."""
+
+import os
+import socket
+import unittest
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import pygame
+
+from padpyght import netinput
+
+
+class FakeJoystick:
+    def __init__(self, name='Test Pad', axes=2, buttons=4, hats=1):
+        self.name = name
+        self.axes = [0.0] * axes
+        self.buttons = [0] * buttons
+        self.hats = [(0, 0)] * hats
+
+    def get_name(self):
+        return self.name
+
+    def get_id(self):
+        return 0
+
+    def get_numaxes(self):
+        return len(self.axes)
+
+    def get_axis(self, axis):
+        return self.axes[axis]
+
+    def get_numbuttons(self):
+        return len(self.buttons)
+
+    def get_button(self, button):
+        return self.buttons[button]
+
+    def get_numhats(self):
+        return len(self.hats)
+
+    def get_hat(self, hat):
+        return self.hats[hat]
+
+
+class CapturingSocket:
+    """Stands in for the sender's socket, keeping what it sends so the test
+    can deliver it however it likes."""
+
+    def __init__(self):
+        self.packets = list()
+
+    def send(self, packet):
+        self.packets.append(packet)
+
+    def close(self):
+        pass
+
+
+def button(down, index):
+    return pygame.event.Event(
+        pygame.JOYBUTTONDOWN if down else pygame.JOYBUTTONUP,
+        joy=0, button=index)
+
+
+def summary(events):
+    return [(event.type, getattr(event, 'button', None)) for event in events]
+
+
+class LoopbackTest(unittest.TestCase):
+    def setUp(self):
+        self.receiver = netinput.Receiver(('127.0.0.1', 0))
+        self.joy = FakeJoystick()
+        self.sender = netinput.Sender(self.receiver.address, self.joy)
+        self.sender._socket.close()
+        self.sender._socket = CapturingSocket()
+        self.wire = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def tearDown(self):
+        self.wire.close()
+        self.receiver.close()
+
+    def packets(self, *event_batches):
+        # one delta per batch, as one poll's worth each.
+        sent = self.sender._socket.packets
+        start = len(sent)
+        for events in event_batches:
+            self.sender.send_events(events)
+        return sent[start:]
+
+    def deliver(self, *packets):
+        # loopback datagrams are queued by the time sendto returns.
+        for packet in packets:
+            self.wire.sendto(packet, self.receiver.address)
+        self.receiver.wait(1.0)
+        return self.receiver.poll()
+
+    def connect(self):
+        self.sender.send_full()
+        full = self.sender._socket.packets[-1]
+        self.deliver(full)
+        self.assertEqual(self.receiver.joy_name, 'Test Pad')
+
+    def test_in_order(self):
+        self.connect()
+        first, second = self.packets([button(True, 1)], [button(False, 1)])
+        self.assertEqual(summary(self.deliver(first, second)),
+                         [(pygame.JOYBUTTONDOWN, 1),
+                          (pygame.JOYBUTTONUP, 1)])
+        self.assertEqual(self.receiver.lost, 0)
+
+    def test_duplicate_is_dropped(self):
+        self.connect()
+        press, = self.packets([button(True, 2)])
+        self.assertEqual(summary(self.deliver(press, press)),
+                         [(pygame.JOYBUTTONDOWN, 2)])
+        self.assertEqual(self.receiver.lost, 0)
+
+    def test_reordered_is_dropped_and_counted(self):
+        self.connect()
+        first, second, third = self.packets(
+            [button(True, 0)], [button(True, 1)], [button(True, 2)])
+        events = self.deliver(first, third, second)
+        self.assertEqual(summary(events), [(pygame.JOYBUTTONDOWN, 0),
+                                           (pygame.JOYBUTTONDOWN, 2)])
+        self.assertEqual(self.receiver.lost, 1)
+
+    def test_full_frame_resyncs_after_loss(self):
+        self.connect()
+        press, release = self.packets([button(True, 3)], [button(False, 3)])
+        self.assertEqual(summary(self.deliver(press)),
+                         [(pygame.JOYBUTTONDOWN, 3)])
+        # the release never arrives, but the next full frame puts it right.
+        self.sender.send_full()
+        full = self.sender._socket.packets[-1]
+        events = self.deliver(full)
+        self.assertEqual(summary(events), [(pygame.JOYBUTTONUP, 3)])
+        self.assertEqual(self.receiver.lost, 1)
+
+    def test_late_full_frame_is_dropped(self):
+        self.connect()
+        self.sender.send_full()
+        stale = self.sender._socket.packets[-1]
+        press, = self.packets([button(True, 0)])
+        self.assertEqual(summary(self.deliver(press)),
+                         [(pygame.JOYBUTTONDOWN, 0)])
+        # the full frame from before the press mustn't undo it.
+        self.assertEqual(self.deliver(stale), [])
+        self.assertEqual(self.receiver.lost, 1)
+
+    def test_restarted_sender_is_taken(self):
+        self.connect()
+        self.sender._sequence += netinput._RESET_GAP
+        self.packets([button(True, 0)])
+        self.deliver(self.sender._socket.packets[-1])
+        self.sender._sequence = 0
+        self.sender.send_full()
+        events = self.deliver(self.sender._socket.packets[-1])
+        self.assertEqual(summary(events), [(pygame.JOYBUTTONUP, 0)])
+
+    def test_non_ascii_name(self):
+        self.joy.name = 'Mando \xc3\xa9lite'
+        self.sender.send_full()
+        self.deliver(self.sender._socket.packets[-1])
+        self.assertEqual(self.receiver.joy_name, u'Mando \xe9lite')
+
+
+
+class TcpLoopbackTest(unittest.TestCase):
+    def test_stream(self):
+        receiver = netinput.Receiver(('127.0.0.1', 0), tcp=True)
+        sender = netinput.Sender(receiver.address, FakeJoystick(), tcp=True)
+        try:
+            sender.send_full()
+            sender.send_events([button(True, 1)])
+            sender.send_events([button(False, 1)])
+            # the full frame's events come first, setting up every control.
+            events = list()
+            for _ in xrange(20):
+                receiver.wait(0.05)
+                events.extend(receiver.poll())
+                if summary(events[-2:]) == [(pygame.JOYBUTTONDOWN, 1),
+                                            (pygame.JOYBUTTONUP, 1)]:
+                    break
+            self.assertEqual(receiver.joy_name, 'Test Pad')
+            self.assertEqual(summary(events[-2:]),
+                             [(pygame.JOYBUTTONDOWN, 1),
+                              (pygame.JOYBUTTONUP, 1)])
+            self.assertEqual(receiver.lost, 0)
+        finally:
+            sender.close()
+            receiver.close()
+
+    def test_receiver_gone(self):
+        receiver = netinput.Receiver(('127.0.0.1', 0), tcp=True)
+        address = receiver.address
+        sender = netinput.Sender(address, FakeJoystick(), tcp=True)
+        try:
+            receiver.wait(0.05)
+            receiver.poll()
+            receiver.close()
+            # the first send after the receiver closes can still go out;
+            # the ones after it fail.
+            for _ in xrange(10):
+                sender.send_events([button(True, 1)])
+                sender.send_full()
+            self.assertIsNone(sender._socket)
+            receiver = netinput.Receiver(address, tcp=True)
+            sender.send_events([button(False, 1)])
+            self.assertIsNone(sender._socket)
+            sender.send_full()
+            for _ in xrange(20):
+                receiver.wait(0.05)
+                receiver.poll()
+                if receiver.joy_name is not None:
+                    break
+            self.assertEqual(receiver.joy_name, 'Test Pad')
+        finally:
+            sender.close()
+            receiver.close()
+
+
+if __name__ == '__main__':
+    unittest.main()